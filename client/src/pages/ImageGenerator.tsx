@@ -12,6 +12,17 @@ const imageGenerationSchema = z.object({
 
 type ImageGenerationFormData = z.infer<typeof imageGenerationSchema>;
 
+// Advertise WebP when the browser can handle it; the server falls back to JPEG otherwise
+const supportsWebp = document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp');
+const imageAccept = supportsWebp ? 'application/json, image/webp, image/jpeg' : 'application/json, image/jpeg';
+
+const extensions: Record<string, string> = {
+  'image/avif': 'avif',
+  'image/webp': 'webp',
+  'image/jpeg': 'jpg',
+  'image/png': 'png',
+};
+
 interface GenerationResult {
   prompt: string;
   imageUrl: string;
@@ -44,7 +55,7 @@ const ImageGenerator: React.FC = () => {
         size: '512x512',
         style: 'realistic',
       };
-      const response = await axios.post('/api/ai/image', payload);
+      const response = await axios.post('/api/ai/image', payload, { headers: { Accept: imageAccept } });
       setResult(response.data.data);
       toast.success('Image generated successfully!');
     } catch (error: any) {
@@ -63,7 +74,7 @@ const ImageGenerator: React.FC = () => {
         const url = URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
-        a.download = `generated-image-${new Date().toISOString().split('T')[0]}.png`;
+        a.download = `generated-image-${new Date().toISOString().split('T')[0]}.${extensions[blob.type] || 'png'}`;
         document.body.appendChild(a);
         a.click();
         document.body.removeChild(a);
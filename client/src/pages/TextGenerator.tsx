@@ -17,6 +17,37 @@ interface GenerationResult {
   generatedText: string;
 }
 
+// Parses a Server-Sent Events body and calls onEvent for each complete event
+const readEventStream = async (
+  body: ReadableStream<Uint8Array>,
+  onEvent: (event: string, data: any) => void
+) => {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      const event = rawEvent.match(/^event: (.*)$/m)?.[1] || 'message';
+      const data = rawEvent.match(/^data: (.*)$/m)?.[1];
+      if (data) {
+        onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+};
+
 const TextGenerator: React.FC = () => {
   const [isGenerating, setIsGenerating] = useState(false);
   const [result, setResult] = useState<GenerationResult | null>(null);
@@ -45,11 +76,37 @@ const TextGenerator: React.FC = () => {
         model: 'gpt-3.5-turbo',
         maxTokens: 500,
       };
-      const response = await axios.post('/api/ai/text', payload);
-      setResult(response.data.data);
+      const authorization = axios.defaults.headers.common['Authorization'];
+      const response = await fetch('/api/ai/text/stream', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          ...(authorization ? { Authorization: String(authorization) } : {}),
+        },
+        body: JSON.stringify(payload),
+      });
+      if (!response.ok || !response.body) {
+        const body = await response.json().catch(() => ({}));
+        throw new Error(body.error || 'Failed to generate text');
+      }
+
+      // Render tokens as the server streams them
+      setResult({ prompt: data.prompt, generatedText: '' });
+      await readEventStream(response.body, (event, eventData) => {
+        if (event === 'delta') {
+          setResult((previous) => previous && {
+            ...previous,
+            generatedText: previous.generatedText + eventData.content,
+          });
+        } else if (event === 'done') {
+          setResult({ prompt: eventData.prompt, generatedText: eventData.generatedText });
+        } else if (event === 'error') {
+          throw new Error(eventData.error || 'Failed to generate text');
+        }
+      });
       toast.success('Text generated successfully!');
     } catch (error: any) {
-      const message = error.response?.data?.error || 'Failed to generate text';
+      const message = error.message || 'Failed to generate text';
       toast.error(message);
     } finally {
       setIsGenerating(false);
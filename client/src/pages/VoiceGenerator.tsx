@@ -12,6 +12,22 @@ const voiceGenerationSchema = z.object({
 
 type VoiceGenerationFormData = z.infer<typeof voiceGenerationSchema>;
 
+// Advertise Opus when the browser can play it; the server falls back to MP3 otherwise
+const probe = document.createElement('audio');
+const audioAccept = [
+  'application/json',
+  ...(probe.canPlayType('audio/webm; codecs="opus"') ? ['audio/webm'] : []),
+  ...(probe.canPlayType('audio/ogg; codecs="opus"') ? ['audio/ogg'] : []),
+  'audio/mpeg',
+].join(', ');
+
+const extensions: Record<string, string> = {
+  'audio/webm': 'webm',
+  'audio/ogg': 'ogg',
+  'audio/mpeg': 'mp3',
+  'audio/wav': 'wav',
+};
+
 interface GenerationResult {
   text: string;
   audioUrl: string;
@@ -46,7 +62,7 @@ const VoiceGenerator: React.FC = () => {
         voice: 'alloy',
         model: 'eleven_monolingual_v1',
       };
-      const response = await axios.post('/api/ai/voice', payload);
+      const response = await axios.post('/api/ai/voice', payload, { headers: { Accept: audioAccept } });
       setResult(response.data.data);
       toast.success('Voice generated successfully!');
     } catch (error: any) {
@@ -76,7 +92,7 @@ const VoiceGenerator: React.FC = () => {
         const url = URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
-        a.download = `generated-voice-${new Date().toISOString().split('T')[0]}.mp3`;
+        a.download = `generated-voice-${new Date().toISOString().split('T')[0]}.${extensions[blob.type] || 'mp3'}`;
         document.body.appendChild(a);
         a.click();
         document.body.removeChild(a);
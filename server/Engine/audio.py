@@ -0,0 +1,70 @@
+import struct
+
+WAV_MIME_TYPES = ("audio/wav", "audio/x-wav", "audio/wave")
+
+
+def sniff_mime_type(data, default="audio/wav"):
+    # Clients that hand back bare bytes don't say what they are
+    if data[:4] == b"RIFF":
+        return "audio/wav"
+    if data[:4] == b"fLaC":
+        return "audio/flac"
+    if data[:4] == b"OggS":
+        return "audio/ogg"
+    if data[:3] == b"ID3" or data[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg"
+    return default
+
+
+def parse_wav(data):
+    # Returns (fmt chunk body, PCM data) from a RIFF/WAVE file
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack("<I", data[offset + 4:offset + 8])[0]
+        body_start = offset + 8
+        if chunk_id == b"fmt ":
+            fmt = data[body_start:body_start + chunk_size]
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk precedes fmt chunk")
+            # Streaming encoders may leave the size as a placeholder, so clamp to what is there
+            return fmt, data[body_start:min(body_start + chunk_size, len(data))]
+        # Chunks are padded to an even number of bytes
+        offset = body_start + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV file has no data chunk")
+
+
+def wav_format(data):
+    # The sample format that decides whether two WAV files can be joined, or None
+    try:
+        return parse_wav(data)[0][:16]
+    except ValueError:
+        return None
+
+
+def build_wav(fmt, pcm):
+    fmt_chunk = b"fmt " + struct.pack("<I", len(fmt)) + fmt + (b"\0" if len(fmt) & 1 else b"")
+    data_chunk = b"data" + struct.pack("<I", len(pcm)) + pcm + (b"\0" if len(pcm) & 1 else b"")
+    return b"RIFF" + struct.pack("<I", 4 + len(fmt_chunk) + len(data_chunk)) + b"WAVE" + fmt_chunk + data_chunk
+
+
+def concat_wav(parts):
+    # Joins WAV files that share one sample format into a single file with a correct header
+    fmt = None
+    pcm = []
+    for part in parts:
+        part_fmt, part_pcm = parse_wav(part)
+        if fmt is None:
+            fmt = part_fmt
+        elif part_fmt[:16] != fmt[:16]:
+            raise ValueError("Cannot concatenate WAV files with different formats")
+        pcm.append(part_pcm)
+    if fmt is None:
+        raise ValueError("No audio to concatenate")
+    return build_wav(fmt, b"".join(pcm))
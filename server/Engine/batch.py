@@ -0,0 +1,115 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from http_pool import close_all
+from framing import dumps
+
+# Batch mode shared by text.py, image.py and voice.py:
+#   python3 image.py --batch prompts.jsonl --out results.jsonl --concurrency 8
+# Each input line is a JSON object with an "id" plus the tool's input field.
+# Results are appended to --out as they finish; ids that already succeeded
+# there are skipped, so an interrupted run can simply be restarted.
+
+
+def parse_args(argv, description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--batch", required=True, metavar="INPUT", help="JSONL file of inputs")
+    parser.add_argument("--out", required=True, metavar="OUTPUT", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--inline", action="store_true",
+                        help="embed media as data URIs instead of writing it to the media store")
+    return parser.parse_args(argv)
+
+
+def completed_ids(output_path):
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if record.get("success"):
+                done.add(record.get("id"))
+    return done
+
+
+def read_records(input_path, skip):
+    with open(input_path, encoding="utf-8") as source:
+        for line_number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record.setdefault("id", line_number)
+            if record["id"] not in skip:
+                yield record
+
+
+async def run_batch(options, handler, field):
+    skip = completed_ids(options.out)
+    total = sum(1 for _ in read_records(options.batch, skip))
+    if skip:
+        print(f"Skipping {len(skip)} completed ids from {options.out}", file=sys.stderr)
+
+    queue = asyncio.Queue(maxsize=options.concurrency * 2)
+    counts = {"done": 0, "failed": 0}
+    started = time.monotonic()
+
+    with open(options.out, "a", encoding="utf-8") as output:
+        async def worker():
+            while True:
+                record = await queue.get()
+                if record is None:
+                    return
+                try:
+                    if field not in record:
+                        result = {"success": False, "error": f"Missing field: {field}"}
+                    else:
+                        result = await handler(record, options)
+                except Exception as e:
+                    result = {"success": False, "error": f"Script execution error: {str(e)}"}
+
+                # Stream each result to disk as soon as it is ready
+                output.write(dumps({"id": record["id"], **result}) + "\n")
+                output.flush()
+
+                counts["done"] += 1
+                if not result.get("success"):
+                    counts["failed"] += 1
+                rate = counts["done"] / max(time.monotonic() - started, 1e-9)
+                print(
+                    f"[{counts['done']}/{total}] {record['id']} {'ok' if result.get('success') else 'failed'} "
+                    f"({rate:.2f}/s, {counts['failed']} failed)",
+                    file=sys.stderr,
+                )
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, options.concurrency))]
+        for record in read_records(options.batch, skip):
+            await queue.put(record)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    return counts
+
+
+def main(argv, description, handler, field):
+    options = parse_args(argv, description)
+
+    async def run():
+        try:
+            return await run_batch(options, handler, field)
+        finally:
+            await close_all()
+
+    counts = asyncio.run(run())
+    print(f"Finished: {counts['done']} processed, {counts['failed']} failed", file=sys.stderr)
+    return 1 if counts["failed"] else 0
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from config import ENGINE_DIR
+from framing import PREFIX
+
+# Offline engine benchmark against the local stub server (stub_server.py):
+#   python3 bench.py                                  every mode, default stub settings
+#   python3 bench.py text image --requests 200 --concurrency 32 -- --rate-503 0.05
+# Each mode gets a fresh engine.py process with its own cache directory and is
+# driven over the same stdin/stdout protocol Node uses. Reported per mode:
+# throughput, p50/p95/p99 latency (and time to first event for streams), errors
+# and the engine's RSS at the end of the run. Options after "--" are passed to the stub server
+# (latency distributions, payload sizes, 503/429 injection; see stub_server.py).
+# --max-errors turns a run into a check, e.g. that transient 503s never reach users:
+#   python3 bench.py text image --requests 60 --max-errors 0 -- --rate-503 0.1 --estimated-time 1
+LONG_TEXT = (
+    "The quick brown fox jumps over the lazy dog. "
+    "Benchmarks should be boring, repeatable and fast to run. "
+    "Every sentence here becomes its own synthesis chunk. "
+    "That keeps the chunked voice path honest about its overhead. "
+)
+
+# mode -> (tool, args for request i, streamed)
+MODES = {
+    "text": ("text", lambda i: {"prompt": f"Benchmark prompt {i}"}, False),
+    "text-stream": ("text", lambda i: {"prompt": f"Benchmark prompt {i}"}, True),
+    # Sized and transcoded the way Node asks for them by default
+    "image": ("image", lambda i: {"prompt": f"Benchmark image {i}", "size": "512x512", "format": "jpeg"}, False),
+    "image-store": ("image", lambda i: {
+        "prompt": f"Benchmark image {i}", "size": "512x512", "format": "jpeg", "store": True, "thumbnail": True,
+    }, False),
+    "voice": ("voice", lambda i: {"text": f"Benchmark sentence number {i}."}, False),
+    "voice-chunked": ("voice", lambda i: {"text": f"{LONG_TEXT}Request {i}.", "chunked": True}, False),
+    "voice-stream": ("voice", lambda i: {"text": f"{LONG_TEXT}Request {i}."}, True),
+}
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(samples) == 1:
+        return {"p50": samples[0], "p95": samples[0], "p99": samples[0]}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": round(cuts[49], 1), "p95": round(cuts[94], 1), "p99": round(cuts[98], 1)}
+
+
+class EngineClient:
+    # Minimal Python counterpart of services/engine.js for one engine process
+    def __init__(self, process):
+        self.process = process
+        self.pending = {}
+        self.first_event = {}
+        self.next_id = 1
+        self.ready = asyncio.get_running_loop().create_future()
+        self.reader = asyncio.create_task(self.read_frames())
+
+    async def read_frames(self):
+        stdout = self.process.stdout
+        while True:
+            try:
+                prefix = await stdout.readexactly(PREFIX.size)
+            except asyncio.IncompleteReadError:
+                break
+            header_length, payload_length = PREFIX.unpack(prefix)
+            message = json.loads(await stdout.readexactly(header_length))
+            if payload_length:
+                await stdout.readexactly(payload_length)
+
+            if message.get("event") == "ready":
+                self.ready.set_result(None)
+            elif message.get("event"):
+                self.first_event.setdefault(message["id"], time.perf_counter())
+            elif message.get("id") in self.pending:
+                self.pending.pop(message["id"]).set_result(message)
+
+        error = RuntimeError("Engine exited")
+        if not self.ready.done():
+            self.ready.set_exception(error)
+        for future in self.pending.values():
+            future.set_exception(error)
+
+    async def request(self, tool, args, stream=False):
+        request_id = self.next_id
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        message = {"id": request_id, "tool": tool, "args": args}
+        if stream:
+            message["stream"] = True
+        self.process.stdin.write(json.dumps(message).encode("utf-8") + b"\n")
+        await self.process.stdin.drain()
+        return request_id, await future
+
+
+async def run_mode(mode, options, stub_url, workdir):
+    tool, make_args, stream = MODES[mode]
+    env = {
+        **os.environ,
+        "HF_ROUTER_URL": stub_url,
+        "HF_INFERENCE_URL": stub_url,
+        "HUGGINGFACE_API_KEY": "bench",
+        "ENGINE_CACHE_DIR": os.path.join(workdir, mode, "cache"),
+        "ENGINE_BLOB_DIR": os.path.join(workdir, mode, "media"),
+        "WARMUP_ENABLED": "false",
+    }
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "engine.py", cwd=ENGINE_DIR, env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    client = EngineClient(process)
+    await client.ready
+
+    slots = asyncio.Semaphore(options.concurrency)
+    latencies, first_events, errors = [], [], []
+
+    async def one(index):
+        async with slots:
+            # Distinct prompts keep caches and single-flight out of the numbers unless asked for
+            started = time.perf_counter()
+            request_id, result = await client.request(tool, make_args(index % options.distinct), stream)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if request_id in client.first_event:
+                first_events.append((client.first_event.pop(request_id) - started) * 1000)
+            if not result.get("success"):
+                errors.append(result.get("error"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(options.requests)))
+    elapsed = time.perf_counter() - started
+
+    _, stats = await client.request("stats", {})
+    process.stdin.close()
+    await process.wait()
+    await client.reader
+
+    report = {
+        "mode": mode,
+        "requests": options.requests,
+        "concurrency": options.concurrency,
+        "errors": len(errors),
+        "throughput_rps": round(options.requests / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+        "rss_mb": stats.get("rss_mb"),
+    }
+    if first_events:
+        report["first_event_ms"] = percentiles(first_events)
+    if errors:
+        report["sample_error"] = errors[0]
+    return report
+
+
+def print_report(reports):
+    print(f"{'mode':<14} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'rss MB':>7}")
+    for report in reports:
+        latency = report["latency_ms"]
+        print(
+            f"{report['mode']:<14} {report['throughput_rps']:>8} {latency['p50']:>9} {latency['p95']:>9} "
+            f"{latency['p99']:>9} {report['errors']:>7} {report['rss_mb']:>7}"
+        )
+        if "first_event_ms" in report:
+            first = report["first_event_ms"]
+            print(f"{'  first event':<14} {'':>8} {first['p50']:>9} {first['p95']:>9} {first['p99']:>9}")
+        if "sample_error" in report:
+            print(f"  e.g. {report['sample_error']}")
+
+
+def start_stub(stub_args):
+    stub = subprocess.Popen(
+        [sys.executable, "stub_server.py", "--port", "0", *stub_args],
+        cwd=ENGINE_DIR, stdout=subprocess.PIPE, text=True,
+    )
+    url = stub.stdout.readline().strip()
+    if not url:
+        stub.wait()
+        raise RuntimeError("Stub server failed to start")
+    return stub, url
+
+
+async def run(options, stub_url):
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="engine-bench-") as workdir:
+        for mode in options.modes:
+            print(f"Running {mode}...", file=sys.stderr)
+            reports.append(await run_mode(mode, options, stub_url, workdir))
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline engine benchmark against a local stub server")
+    parser.add_argument("modes", nargs="*", metavar="MODE", help=f"any of: {', '.join(MODES)} (default: all)")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct", type=int, help="distinct inputs to cycle through (default: all distinct)")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    parser.add_argument("--max-errors", type=int, metavar="N", help="exit 1 if any mode has more than N errors")
+    argv = sys.argv[1:] if argv is None else argv
+    split = argv.index("--") if "--" in argv else len(argv)
+    options = parser.parse_args(argv[:split])
+    stub_args = argv[split + 1:]
+    unknown = [mode for mode in options.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode {unknown[0]!r} (choose from {', '.join(MODES)})")
+    options.modes = options.modes or list(MODES)
+    options.distinct = options.distinct or options.requests
+
+    stub, stub_url = start_stub(stub_args)
+    try:
+        reports = asyncio.run(run(options, stub_url))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print_report(reports)
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as output:
+            json.dump({"created": time.time(), "stub_args": stub_args, "reports": reports}, output, indent=2)
+    if options.max_errors is not None:
+        failed = [report["mode"] for report in reports if report["errors"] > options.max_errors]
+        if failed:
+            print(f"More than {options.max_errors} errors in: {', '.join(failed)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
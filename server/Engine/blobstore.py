@@ -0,0 +1,75 @@
+import os
+import hashlib
+
+from config import ENGINE_DIR
+from timings import stage
+
+# Content-addressed store for generated media, served by Express under MEDIA_URL
+BLOB_DIR = os.environ.get("ENGINE_BLOB_DIR", os.path.join(os.path.dirname(ENGINE_DIR), "media"))
+MEDIA_URL = os.environ.get("ENGINE_MEDIA_URL", "/media").rstrip("/")
+
+EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+    "audio/wav": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/flac": ".flac",
+    "audio/mpeg": ".mp3",
+    "audio/ogg": ".ogg",
+    "audio/webm": ".webm",
+}
+
+
+def relative_path(digest, mime_type):
+    # Two levels of fan-out keep directories small: ab/cd/abcd....png
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{EXTENSIONS.get(mime_type, '.bin')}"
+
+
+def describe(digest, mime_type, size):
+    path = relative_path(digest, mime_type)
+    return {
+        "hash": digest,
+        "url": f"{MEDIA_URL}/{path}",
+        "mime_type": mime_type,
+        "size": size,
+    }
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@stage("store")
+def put(data, mime_type):
+    digest = content_hash(data)
+    path = os.path.join(BLOB_DIR, relative_path(digest, mime_type))
+
+    # Identical outputs share one file
+    if not os.path.exists(path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        import tempfile
+
+        # Write to a temporary file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    return describe(digest, mime_type, len(data))
+
+
+def get(digest, mime_type):
+    path = os.path.join(BLOB_DIR, relative_path(digest, mime_type))
+    try:
+        with open(path, "rb") as blob:
+            return blob.read()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,233 @@
+import os
+import time
+import threading
+
+from cache import CACHE_DIR
+from timings import stage
+
+# Per-model circuit breaker whose state lives in a SQLite file, so every engine
+# worker on the host sees the same health picture.
+#   closed    -> calls flow; opens once the error rate over WINDOW_SECONDS reaches ERROR_RATE
+#   open      -> calls fail fast until the cool-down (or a loading model's estimated load time) ends
+#   half_open -> one worker sends a probe; success closes the circuit, failure re-opens it
+ENABLED = os.environ.get("BREAKER_ENABLED", "true").lower() == "true"
+WINDOW_SECONDS = int(os.environ.get("BREAKER_WINDOW_SECONDS", "60"))
+BUCKET_SECONDS = 5
+MIN_REQUESTS = int(os.environ.get("BREAKER_MIN_REQUESTS", "5"))
+ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+# Calls slower than this count as failures (0 disables)
+SLOW_CALL_MS = float(os.environ.get("BREAKER_SLOW_CALL_MS", "0"))
+# A probe that never reports back is abandoned after this long
+PROBE_TIMEOUT_SECONDS = float(os.environ.get("BREAKER_PROBE_TIMEOUT_SECONDS", "120"))
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_in, probing=False):
+        super().__init__(f"{name} is unavailable right now, please try again in {max(1, round(retry_in))} seconds")
+        self.name = name
+        self.retry_in = retry_in
+        # Another worker's probe is deciding; retry_in is only its timeout
+        self.probing = probing
+
+
+class CircuitBreaker:
+    def __init__(self, path):
+        import sqlite3
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS circuits ("
+            "name TEXT PRIMARY KEY, state TEXT NOT NULL, open_until REAL NOT NULL DEFAULT 0, "
+            "probe_started REAL NOT NULL DEFAULT 0)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outcomes ("
+            "name TEXT NOT NULL, bucket INTEGER NOT NULL, ok INTEGER NOT NULL DEFAULT 0, "
+            "failed INTEGER NOT NULL DEFAULT 0, latency_ms REAL NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (name, bucket))"
+        )
+
+    def state(self, name):
+        row = self.db.execute(
+            "SELECT state, open_until, probe_started FROM circuits WHERE name = ?", (name,)
+        ).fetchone()
+        return row or ("closed", 0.0, 0.0)
+
+    def check(self, name):
+        # Raises CircuitOpen when the call should not be made; returns the probe's
+        # claim when this call is the half-open probe, else None
+        now = time.time()
+        with self.lock:
+            state, open_until, probe_started = self.state(name)
+            if state == "closed":
+                return None
+            if state == "open" and now < open_until:
+                raise CircuitOpen(name, open_until - now)
+            if state == "half_open" and now - probe_started < PROBE_TIMEOUT_SECONDS:
+                raise CircuitOpen(name, PROBE_TIMEOUT_SECONDS - (now - probe_started), probing=True)
+
+            # Cool-down over (or the last probe went missing): claim the probe atomically
+            claimed = self.db.execute(
+                "UPDATE circuits SET state = 'half_open', probe_started = ? "
+                "WHERE name = ? AND state = ? AND probe_started = ?",
+                (now, name, state, probe_started),
+            ).rowcount
+            if not claimed:
+                raise CircuitOpen(name, PROBE_TIMEOUT_SECONDS, probing=True)
+            return now
+
+    def release(self, name, claim):
+        # A cancelled probe says nothing about the model; hand the probe to the next caller
+        # right away instead of leaving the circuit half open until PROBE_TIMEOUT_SECONDS
+        if claim is None:
+            return
+        with self.lock:
+            self.db.execute(
+                "UPDATE circuits SET state = 'open', open_until = ?, probe_started = 0 "
+                "WHERE name = ? AND state = 'half_open' AND probe_started = ?",
+                (time.time(), name, claim),
+            )
+
+    def record(self, name, ok, latency_ms, open_for=None):
+        now = time.time()
+        if SLOW_CALL_MS and latency_ms > SLOW_CALL_MS:
+            ok = False
+        bucket = int(now // BUCKET_SECONDS)
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute(
+                    "INSERT INTO outcomes (name, bucket, ok, failed, latency_ms) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (name, bucket) DO UPDATE SET ok = ok + excluded.ok, "
+                    "failed = failed + excluded.failed, latency_ms = latency_ms + excluded.latency_ms",
+                    (name, bucket, int(ok), int(not ok), latency_ms),
+                )
+                self.db.execute(
+                    "DELETE FROM outcomes WHERE name = ? AND bucket < ?",
+                    (name, bucket - WINDOW_SECONDS // BUCKET_SECONDS),
+                )
+
+                state = self.state(name)[0]
+                # A loading model says how long it needs; that sets how long to stay open, never whether to open
+                open_until = now + (OPEN_SECONDS if open_for is None else open_for)
+                if ok:
+                    if state != "closed":
+                        self.set_state(name, "closed", 0)
+                elif state == "half_open":
+                    self.set_state(name, "open", open_until)
+                elif state == "closed":
+                    ok_count, failed_count = self.window(name, bucket)
+                    total = ok_count + failed_count
+                    if total >= MIN_REQUESTS and failed_count / total >= ERROR_RATE:
+                        self.set_state(name, "open", open_until)
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def set_state(self, name, state, open_until):
+        self.db.execute(
+            "INSERT INTO circuits (name, state, open_until, probe_started) VALUES (?, ?, ?, 0) "
+            "ON CONFLICT (name) DO UPDATE SET state = excluded.state, "
+            "open_until = excluded.open_until, probe_started = 0",
+            (name, state, open_until),
+        )
+
+    def window(self, name, bucket):
+        row = self.db.execute(
+            "SELECT COALESCE(SUM(ok), 0), COALESCE(SUM(failed), 0) FROM outcomes "
+            "WHERE name = ? AND bucket > ?",
+            (name, bucket - WINDOW_SECONDS // BUCKET_SECONDS),
+        ).fetchone()
+        return row[0], row[1]
+
+    def stats(self):
+        bucket = int(time.time() // BUCKET_SECONDS)
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT name, SUM(ok), SUM(failed), SUM(latency_ms) FROM outcomes "
+                "WHERE bucket > ? GROUP BY name",
+                (bucket - WINDOW_SECONDS // BUCKET_SECONDS,),
+            ).fetchall()
+            states = {row[0]: row[1] for row in self.db.execute("SELECT name, state FROM circuits")}
+        circuits = {}
+        for name, ok_count, failed_count, latency_ms in rows:
+            total = ok_count + failed_count
+            circuits[name] = {
+                "state": states.get(name, "closed"),
+                "requests": total,
+                "error_rate": round(failed_count / total, 4) if total else 0.0,
+                "avg_latency_ms": round(latency_ms / total, 1) if total else 0.0,
+            }
+        for name, state in states.items():
+            circuits.setdefault(name, {"state": state, "requests": 0, "error_rate": 0.0, "avg_latency_ms": 0.0})
+        return circuits
+
+
+class DisabledBreaker:
+    def check(self, name):
+        return None
+
+    def release(self, name, claim):
+        pass
+
+    def record(self, name, ok, latency_ms, open_for=None):
+        pass
+
+    def stats(self):
+        return {}
+
+
+_breaker = None
+
+
+def get_breaker():
+    global _breaker
+    if _breaker is None:
+        if ENABLED:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _breaker = CircuitBreaker(os.path.join(CACHE_DIR, "breaker.sqlite3"))
+        else:
+            _breaker = DisabledBreaker()
+    return _breaker
+
+
+def is_failure(status_code):
+    # Overload and server errors say something about the model's health; client errors don't
+    return status_code == 429 or status_code >= 500
+
+
+async def guarded(name, send):
+    # Runs send() under the breaker for name and records how it went
+    from http_pool import retry_after_seconds
+    from warmup import MODELS, observe
+    from metrics import observe_upstream
+
+    breaker = get_breaker()
+    claim = breaker.check(name)
+    started = time.monotonic()
+    try:
+        with stage("upstream"):
+            response = await send()
+    except Exception:
+        breaker.record(name, False, (time.monotonic() - started) * 1000)
+        observe_upstream(name, "error", time.monotonic() - started)
+        raise
+    except BaseException:
+        # Cancelled by a deadline, a client disconnect or a hedge/sibling that finished first
+        breaker.release(name, claim)
+        raise
+
+    open_for = None
+    if response.status_code == 503 and name in MODELS:
+        # Only inference API models (the ones warmup.py keeps loaded) report load times;
+        # if the circuit opens, it stays open until the model should be up
+        open_for = retry_after_seconds(response)
+    breaker.record(name, not is_failure(response.status_code), (time.monotonic() - started) * 1000, open_for)
+    observe_upstream(name, response.status_code, time.monotonic() - started)
+    observe(name, response)
+    return response
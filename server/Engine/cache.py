@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import ENGINE_DIR
+
+CACHE_DIR = os.environ.get("ENGINE_CACHE_DIR", os.path.join(ENGINE_DIR, ".cache"))
+
+
+def make_key(*parts):
+    # Stable digest of the JSON-encoded key parts
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    # Two-tier cache for JSON-serializable results: an in-process LRU in front
+    # of a SQLite file that every engine worker on the host shares
+
+    def __init__(self, name, ttl_seconds=86400, memory_entries=1024, disk_bytes=256 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "memory_evictions": 0, "disk_evictions": 0}
+        self.lock = threading.Lock()
+
+        self.db = None
+        if disk_bytes > 0:
+            import sqlite3
+
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self.db = sqlite3.connect(os.path.join(CACHE_DIR, f"{name}.sqlite3"), timeout=5, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            self.db.commit()
+            self.disk_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self.memory[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self.db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+                    self.db.commit()
+                    value = self.decode(row[0])
+                    self.remember(key, row[1], value)
+                    self.counters["disk_hits"] += 1
+                    return value
+
+            self.counters["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self.lock:
+            self.remember(key, expires_at, value)
+            if self.db is None:
+                return
+
+            encoded = self.encode(value)
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, encoded, len(encoded), expires_at, now),
+            )
+            self.db.commit()
+            self.disk_size += len(encoded)
+            if self.disk_size > self.disk_bytes:
+                self.evict_disk(now)
+
+    def encode(self, value):
+        return json.dumps(value)
+
+    def decode(self, stored):
+        return json.loads(stored)
+
+    def remember(self, key, expires_at, value):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    def evict_disk(self, now):
+        # Drop expired rows, then least recently used ones until 90% of the budget is free
+        self.db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        self.disk_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = self.disk_bytes * 0.9
+        while self.disk_size > target:
+            rows = self.db.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            self.db.executemany("DELETE FROM entries WHERE key = ?", [(row[0],) for row in rows])
+            self.disk_size -= sum(row[1] for row in rows)
+            self.counters["disk_evictions"] += len(rows)
+        self.db.commit()
+
+    def stats(self):
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_bytes": self.disk_size if self.db is not None else 0,
+        }
+
+
+class BytesCache(ResponseCache):
+    # The same two tiers for raw bytes (synthesized audio segments); SQLite keeps
+    # them as BLOBs whatever the column type, and sizes count bytes
+    def encode(self, value):
+        return bytes(value)
+
+    def decode(self, stored):
+        return bytes(stored)
@@ -0,0 +1,18 @@
+import os
+
+# Load environment variables once per process so long-lived engines keep them warm
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_PATH = os.path.join(os.path.dirname(ENGINE_DIR), '.env')
+
+# Deployments that set variables directly have no .env and skip importing dotenv
+if os.path.exists(ENV_PATH):
+    import dotenv
+    dotenv.load_dotenv(dotenv_path=ENV_PATH)
+
+# Upstream base URLs; bench.py points them at a local stub server to run offline
+ROUTER_URL = os.environ.get('HF_ROUTER_URL', 'https://router.huggingface.co').rstrip('/')
+INFERENCE_URL = os.environ.get('HF_INFERENCE_URL', 'https://api-inference.huggingface.co').rstrip('/')
+
+
+def get_api_key():
+    return os.environ.get('HUGGINGFACE_API_KEY')
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# The tools import their heavy dependencies lazily to keep one-shot CLI runs
+# fast; a long-lived engine pays those costs once up front instead
+import httpx  # noqa: F401
+import sqlite3  # noqa: F401
+import tempfile  # noqa: F401
+
+from config import get_api_key
+from http_pool import close_all
+from text import generate_text, stream_text, get_cache as get_text_cache, get_semantic_cache
+from image import generate_image
+from voice import generate_voice, stream_voice, get_segment_cache
+from cache import make_key
+from singleflight import SingleFlight
+from breaker import get_breaker
+import warmup
+from retry import set_deadline
+from framing import encode_frame
+import timings
+import metrics
+
+# Protocol: one JSON object per line on stdin, one binary frame per message on
+# stdout (see framing.py) so media is sent as raw bytes
+#   -> {"id": 1, "tool": "text", "args": {"prompt": "..."}, "deadline_ms": 60000}
+#   <- {"id": 1, "success": true, "content": "...", "prompt": "..."}
+#   -> {"id": 2, "tool": "cancel", "args": {"id": 1}}
+#   -> {"id": 3, "tool": "metrics"}  <- {"id": 3, "success": true, "text": "<Prometheus text format>"}
+# Requests with "timings": true get a "timings" field of per-stage milliseconds
+# (queue, upstream, retry_wait, cache, store, ...) plus the engine-side total.
+# Requests are served concurrently, so responses may arrive out of order.
+# Streaming requests ("stream": true) first emit {"id": 1, "event": "delta", ...}
+# messages and then the usual final response.
+STREAM_TOOLS = {
+    "text": lambda args: stream_text(args["prompt"], args.get("max_tokens")),
+    "voice": lambda args: stream_voice(args["text"], args.get("store", False), args.get("format")),
+}
+
+TOOLS = {
+    "text": lambda args: generate_text(args["prompt"], args.get("max_tokens")),
+    "image": lambda args: generate_image(
+        args["prompt"], args.get("store", False), args.get("size"), args.get("thumbnail", False), args.get("format")
+    ),
+    "voice": lambda args: generate_voice(
+        args["text"], args.get("store", False), args.get("chunked", False), args.get("hedged", False),
+        args.get("format")
+    ),
+}
+
+# Concurrency limits for a single engine process
+MAX_IN_FLIGHT = int(os.environ.get("ENGINE_MAX_IN_FLIGHT", "256"))
+MAX_THREADS = int(os.environ.get("ENGINE_THREADS", "32"))
+DEFAULT_DEADLINE_MS = int(os.environ.get("ENGINE_DEADLINE_MS", "120000"))
+
+
+def memory_usage_mb():
+    # Current resident set size, falling back to the peak where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def write_message(message):
+    out = sys.stdout.buffer
+    for part in encode_frame(message):
+        out.write(part)
+    out.flush()
+
+
+class Engine:
+    def __init__(self):
+        self.in_flight = {}
+        # Requests waiting for a free slot
+        self.waiting = 0
+        self.slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        self.flights = SingleFlight()
+
+    def handle_control(self, request_id, tool, args):
+        if tool == "ping":
+            return {"id": request_id, "success": True}
+
+        if tool == "stats":
+            text_cache = get_text_cache()
+            semantic_cache = get_semantic_cache()
+            segment_cache = get_segment_cache()
+            return {
+                "id": request_id,
+                "success": True,
+                "pid": os.getpid(),
+                "rss_mb": round(memory_usage_mb(), 1),
+                "in_flight": len(self.in_flight),
+                "text_cache": text_cache.stats() if text_cache else None,
+                "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+                "voice_segment_cache": segment_cache.stats() if segment_cache else None,
+                "single_flight": self.flights.stats(),
+                "circuits": get_breaker().stats(),
+                "models": warmup.get_warmup().stats(),
+            }
+
+        if tool == "metrics":
+            return {"id": request_id, "success": True, "text": self.render_metrics()}
+
+        if tool == "cancel":
+            task = self.in_flight.get(args.get("id"))
+            if task is not None:
+                task.cancel()
+            return {"id": request_id, "success": True, "cancelled": task is not None}
+
+        return None
+
+    def render_metrics(self):
+        # Gauges and counts kept elsewhere are copied in at scrape time
+        metrics.in_flight.set(value=len(self.in_flight))
+        metrics.queue_depth.set(value=self.waiting)
+        metrics.coalesced_total.set(value=self.flights.counters["coalesced"])
+        metrics.resident_memory.set(value=int(memory_usage_mb() * 1024 * 1024))
+        for name, cache in (("text", get_text_cache()), ("voice_segments", get_segment_cache())):
+            if cache is None:
+                continue
+            cache_stats = cache.stats()
+            for result in ("memory_hits", "disk_hits", "misses"):
+                metrics.cache_lookups.set(name, result, value=cache_stats[result])
+            metrics.cache_hit_ratio.set(name, value=cache_stats["hit_ratio"])
+        semantic_cache = get_semantic_cache()
+        if semantic_cache is not None:
+            cache_stats = semantic_cache.stats()
+            metrics.cache_lookups.set("semantic", "hits", value=cache_stats["hits"])
+            metrics.cache_lookups.set("semantic", "misses", value=cache_stats["misses"])
+            metrics.cache_hit_ratio.set("semantic", value=cache_stats["hit_ratio"])
+        for model, circuit in get_breaker().stats().items():
+            metrics.circuit_open.set(model, value=int(circuit["state"] != "closed"))
+        for model, readiness in warmup.get_warmup().stats().items():
+            metrics.model_ready.set(model, value=int(readiness["state"] == "ready"))
+        return metrics.render()
+
+    async def acquire_slot(self):
+        self.waiting += 1
+        try:
+            with timings.stage("queue"):
+                await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+    async def call_tool(self, handler, args):
+        await self.acquire_slot()
+        try:
+            return await handler(args)
+        finally:
+            self.slots.release()
+
+    async def consume_stream(self, request_id, handler, args):
+        await self.acquire_slot()
+        try:
+            async for message in handler(args):
+                if "event" not in message:
+                    return message
+                write_message({"id": request_id, **message})
+        finally:
+            self.slots.release()
+        return {"success": False, "error": "Stream ended without a result"}
+
+    async def respond(self, request_id, tool, work, deadline_ms, timed=False):
+        # Upstream retries inside this request stop before the deadline would be overrun
+        set_deadline(deadline_ms)
+        # Coalesced requests get the shared call's stages added in (see singleflight.py)
+        recorded = timings.start() if timed else None
+        started = time.perf_counter()
+        outcome = None
+        try:
+            result = await asyncio.wait_for(work, deadline_ms / 1000)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            result = {"success": False, "error": f"Deadline of {deadline_ms} ms exceeded"}
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            result = {"success": False, "error": "Request cancelled"}
+        except KeyError as e:
+            result = {"success": False, "error": f"Missing argument: {e}"}
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            result = {"success": False, "error": f"Script execution error: {str(e)}"}
+        finally:
+            self.in_flight.pop(request_id, None)
+
+        elapsed = time.perf_counter() - started
+        metrics.requests_total.inc(tool, outcome or ("success" if result.get("success") else "error"))
+        metrics.request_seconds.observe(tool, value=elapsed)
+        if recorded is not None:
+            recorded["total"] = elapsed * 1000
+            result = {**result, "timings": timings.rounded(recorded)}
+        write_message({"id": request_id, **result})
+
+    def dispatch(self, request):
+        request_id = request.get("id")
+        tool = request.get("tool")
+        args = request.get("args") or {}
+
+        control = self.handle_control(request_id, tool, args)
+        if control is not None:
+            write_message(control)
+            return
+
+        stream = bool(request.get("stream"))
+        handler = (STREAM_TOOLS if stream else TOOLS).get(tool)
+        if handler is None:
+            kind = "streaming tool" if stream else "tool"
+            write_message({"id": request_id, "success": False, "error": f"Unknown {kind}: {tool}"})
+            return
+
+        deadline_ms = request.get("deadline_ms") or DEFAULT_DEADLINE_MS
+        if stream:
+            # Streams are per-client, so they bypass single-flight coalescing
+            work = self.consume_stream(request_id, handler, args)
+        else:
+            # Identical concurrent requests share a single upstream call
+            work = self.flights.do(make_key(tool, args), lambda: self.call_tool(handler, args))
+        self.in_flight[request_id] = asyncio.create_task(
+            self.respond(request_id, tool, work, deadline_ms, bool(request.get("timings")))
+        )
+
+
+async def serve():
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=MAX_THREADS))
+
+    # stdin gets a thread of its own, so blocking tool work filling the default
+    # executor can never stop the engine from reading requests
+    stdin_reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stdin")
+    engine = Engine()
+    # Keeps the image and voice models loaded between requests (see warmup.py)
+    keep_warm = asyncio.create_task(warmup.run(get_api_key()))
+    try:
+        write_message({"id": None, "event": "ready"})
+
+        # Reading stdin on a thread works the same on every platform
+        while True:
+            line = await loop.run_in_executor(stdin_reader, sys.stdin.readline)
+            if not line:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                write_message({"id": None, "success": False, "error": f"Invalid request: {e}"})
+                continue
+            engine.dispatch(request)
+
+        # stdin closed: let in-flight requests finish before exiting
+        if engine.in_flight:
+            await asyncio.gather(*engine.in_flight.values(), return_exceptions=True)
+    finally:
+        keep_warm.cancel()
+        await close_all()
+
+
+def main():
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
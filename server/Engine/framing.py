@@ -0,0 +1,49 @@
+import json
+import base64
+import struct
+
+# Engine -> Node frames: two big-endian uint32 lengths, a JSON header, then raw bytes.
+#   [header length][payload length][header JSON][payload]
+# Media fields are replaced in the header by
+#   {"$media": true, "mime_type": ..., "offset": ..., "length": ...}
+# pointing into the payload, so images and audio cross the pipe once, unencoded.
+PREFIX = struct.Struct(">II")
+
+
+class Media:
+    # Raw generated media; stays binary until something needs JSON
+    __slots__ = ("data", "mime_type")
+
+    def __init__(self, data, mime_type):
+        self.data = data
+        self.mime_type = mime_type
+
+    def data_uri(self):
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+def encode_json(value):
+    # json.dumps default hook: where JSON is the only transport (CLI, batch files) media becomes a data URI
+    if isinstance(value, Media):
+        return value.data_uri()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    return json.dumps(value, default=encode_json)
+
+
+def encode_frame(message):
+    # Returns the frame as a list of byte strings so the payload is never copied
+    header = {}
+    payload = []
+    offset = 0
+    for key, value in message.items():
+        if isinstance(value, Media):
+            header[key] = {"$media": True, "mime_type": value.mime_type, "offset": offset, "length": len(value.data)}
+            payload.append(value.data)
+            offset += len(value.data)
+        else:
+            header[key] = value
+    header_bytes = json.dumps(header).encode("utf-8")
+    return [PREFIX.pack(len(header_bytes), offset), header_bytes, *payload]
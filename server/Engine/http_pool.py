@@ -0,0 +1,93 @@
+import os
+from urllib.parse import urlsplit
+
+from timings import stage
+
+# Connection pools are kept per upstream host so each one can be sized for its
+# traffic, e.g. ENGINE_POOL_SIZES="router.huggingface.co=64,api-inference.huggingface.co=16"
+DEFAULT_POOL_SIZE = int(os.environ.get("ENGINE_POOL_SIZE", "32"))
+KEEPALIVE_EXPIRY = float(os.environ.get("ENGINE_KEEPALIVE_SECONDS", "120"))
+CONNECT_TIMEOUT = float(os.environ.get("ENGINE_CONNECT_TIMEOUT_SECONDS", "10"))
+USE_HTTP2 = os.environ.get("ENGINE_HTTP2", "false").lower() == "true"
+
+_clients = {}
+
+
+def parse_pool_sizes(spec):
+    sizes = {}
+    for entry in spec.split(","):
+        host, _, size = entry.strip().partition("=")
+        if host and size.isdigit():
+            sizes[host] = int(size)
+    return sizes
+
+
+POOL_SIZES = parse_pool_sizes(os.environ.get("ENGINE_POOL_SIZES", ""))
+
+
+def http2_available():
+    # HTTP/2 needs the optional h2 package (pip install httpx[http2])
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_client(url):
+    host = urlsplit(url).netloc
+    client = _clients.get(host)
+    if client is None:
+        with stage("client"):
+            client = new_client(host)
+        _clients[host] = client
+    return client
+
+
+def new_client(host):
+    # httpx is imported on first use so paths that never go upstream skip it
+    import httpx
+
+    size = POOL_SIZES.get(host, DEFAULT_POOL_SIZE)
+    return httpx.AsyncClient(
+        # Engines enforce their own per-request deadlines, so only connecting is bounded here
+        timeout=httpx.Timeout(None, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=size,
+            max_keepalive_connections=size,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        http2=USE_HTTP2 and http2_available(),
+    )
+
+
+async def close_all():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def retry_after_seconds(response):
+    # How long the upstream asked us to wait: the Retry-After header, or the
+    # inference API's estimated_time while a model is loading
+    header = response.headers.get("retry-after")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            from email.utils import parsedate_to_datetime
+            from datetime import datetime, timezone
+            try:
+                return max(0.0, (parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+
+    if response.status_code == 503:
+        try:
+            estimated = response.json().get("estimated_time")
+        except (ValueError, AttributeError):
+            return None
+        if isinstance(estimated, (int, float)):
+            return max(0.0, float(estimated))
+    return None
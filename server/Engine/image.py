@@ -1,61 +1,115 @@
-import requests
 import sys
-import json
-import os
-import dotenv
-import base64
+import asyncio
+from config import INFERENCE_URL, get_api_key
+from http_pool import get_client, close_all
+from breaker import CircuitOpen, guarded
+from retry import with_retries
+from warmup import ensure_ready, register
+import blobstore
+import imaging
+from framing import Media, dumps
 
-# Load environment variables
-dotenv.load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+MODEL = "black-forest-labs/FLUX.1-schnell"
+API_URL = f"{INFERENCE_URL}/models/{MODEL}"
+# Smallest, fastest render the model accepts; enough to keep it loaded
+register(MODEL, API_URL, {"inputs": "warmup", "parameters": {"width": 256, "height": 256, "num_inference_steps": 1}})
 
-API_URL = "https://api-inference.huggingface.co/models/black-forest-labs/FLUX.1-schnell"
 
-# Get API key from environment variable
-api_key = os.getenv('HUGGINGFACE_API_KEY')
-if not api_key:
-    print(json.dumps({"success": False, "error": "HUGGINGFACE_API_KEY not found in environment variables"}))
-    exit(1)
+async def generate_image(user_prompt, store=False, size=None, thumbnail=False, output_format=None):
+    # Get API key from environment variable
+    api_key = get_api_key()
+    if not api_key:
+        return {"success": False, "error": "HUGGINGFACE_API_KEY not found in environment variables"}
 
-headers = {"Authorization": f"Bearer {api_key}"}
+    import httpx
 
-# Get prompt from command line argument or stdin
-if len(sys.argv) > 1:
-    user_prompt = " ".join(sys.argv[1:])
-else:
-    user_prompt = input("What type of image would you like to generate? \n")
-payload = {
-    "inputs": user_prompt,
-}
-
-response = requests.post(API_URL, headers=headers, json=payload)
+    headers = {"Authorization": f"Bearer {api_key}"}
+    payload = {
+        "inputs": user_prompt,
+    }
 
-if response.status_code == 200:
     try:
-        # Convert image directly to base64 without saving to file
-        image_data = base64.b64encode(response.content).decode('utf-8')
-        
-        result = {
-            "success": True,
-            "image_data": f"data:image/png;base64,{image_data}",
-            "prompt": user_prompt
+        # A load the warmup pinger knows about is waited out here, or failed fast if it won't finish in time
+        await ensure_ready(MODEL)
+        # Retries wait out 429s and model loading (estimated_time) while the deadline allows
+        response = await with_retries(
+            lambda: guarded(MODEL, lambda: get_client(API_URL).post(API_URL, headers=headers, json=payload))
+        )
+    except CircuitOpen as e:
+        # Fail fast while the model is cold or erroring instead of queueing doomed calls
+        return {"success": False, "error": str(e)}
+    except httpx.HTTPError as e:
+        return {"success": False, "error": f"Request failed: {str(e)}"}
+
+    if response.status_code == 200:
+        try:
+            # Resize, thumbnail and transcode in the imaging worker pool
+            processed = await imaging.transform(response.content, size, thumbnail, output_format, store)
+            data, mime_type, blob = processed["image"]
+            if store:
+                # Write into the content-addressed store and hand back a short URL
+                if blob is None:
+                    blob = await asyncio.to_thread(blobstore.put, data, mime_type)
+                result = {
+                    "success": True,
+                    "image_url": blob["url"],
+                    "image": blob,
+                    "prompt": user_prompt
+                }
+                if processed["thumbnail"] is not None:
+                    result["thumbnail_url"] = processed["thumbnail"][2]["url"]
+                    result["thumbnail"] = processed["thumbnail"][2]
+                return result
+
+            # Hand back the raw bytes; they are only base64-encoded if they end up in JSON
+            result = {
+                "success": True,
+                "image_data": Media(data, mime_type),
+                "prompt": user_prompt
+            }
+            if processed["thumbnail"] is not None:
+                result["thumbnail_data"] = Media(processed["thumbnail"][0], processed["thumbnail"][1])
+            return result
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Error processing image: {str(e)}"
+            }
+    elif response.status_code == 503:
+        return {
+            "success": False,
+            "error": "Model is loading, please try again in a few minutes"
         }
-        print(json.dumps(result))
-        
-    except Exception as e:
-        error_result = {
+    else:
+        return {
             "success": False,
-            "error": f"Error processing image: {str(e)}"
+            "error": f"API Error {response.status_code}: {response.text}"
         }
-        print(json.dumps(error_result))
-elif response.status_code == 503:
-    error_result = {
-        "success": False,
-        "error": "Model is loading, please try again in a few minutes"
-    }
-    print(json.dumps(error_result))
-else:
-    error_result = {
-        "success": False,
-        "error": f"API Error {response.status_code}: {response.text}"
-    }
-    print(json.dumps(error_result))
+
+
+async def main(user_prompt):
+    try:
+        return await generate_image(user_prompt)
+    finally:
+        await close_all()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--batch"]:
+        import batch
+        sys.exit(batch.main(
+            sys.argv[1:], "Generate an image for every prompt in a JSONL file",
+            lambda record, options: generate_image(record["prompt"], store=not options.inline),
+            "prompt",
+        ))
+
+    # Get prompt from command line argument or stdin
+    if len(sys.argv) > 1:
+        user_prompt = " ".join(sys.argv[1:])
+    else:
+        user_prompt = input("What type of image would you like to generate? \n")
+
+    result = asyncio.run(main(user_prompt))
+    print(dumps(result))
+    if not get_api_key():
+        sys.exit(1)
@@ -0,0 +1,180 @@
+import io
+import os
+import sys
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import make_key
+from timings import stage
+from variants import VariantCache
+import blobstore
+
+# Post-processing for generated images: FLUX always renders a full resolution PNG, so
+# the engine scales the result down to the size the user asked for, adds a small
+# thumbnail and transcodes both to a compressed format (WebP, AVIF, progressive
+# JPEG or PNG). Pillow is optional; without it images are passed through unchanged.
+# Rendered variants are remembered per (source hash, size, format, quality) in a
+# VariantCache (see variants.py), so an image is never resized or encoded twice.
+THUMBNAIL_SIZE = int(os.environ.get("IMAGE_THUMBNAIL_SIZE", "128"))
+MAX_SIZE = 2048
+
+# format -> (mime type, Pillow encoder, quality setting)
+FORMATS = {
+    "avif": ("image/avif", "AVIF", int(os.environ.get("IMAGE_AVIF_QUALITY", "60"))),
+    "webp": ("image/webp", "WEBP", int(os.environ.get("IMAGE_WEBP_QUALITY", "80"))),
+    "jpeg": ("image/jpeg", "JPEG", int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))),
+    "png": ("image/png", "PNG", None),
+}
+# Used when a requested format has no encoder in this Pillow build (AVIF needs Pillow 11.2+ or pillow-avif-plugin)
+FALLBACKS = {"avif": "webp", "webp": "jpeg", "jpeg": "png"}
+
+# Encoding is CPU-bound; a dedicated pool keeps it from starving the blob writes and
+# stdin reads that share the default executor. Pillow releases the GIL while it works.
+WORKERS = int(os.environ.get("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor = None
+_variants = None
+_warned = False
+
+
+def get_variant_cache():
+    global _variants
+    if _variants is None:
+        _variants = VariantCache(
+            "image_variants",
+            ttl_seconds=int(os.environ.get("IMAGE_VARIANT_TTL_SECONDS", "2592000")),
+            memory_entries=int(os.environ.get("IMAGE_VARIANT_CACHE_MEMORY_ENTRIES", "32")),
+            disk_bytes=int(os.environ.get("IMAGE_VARIANT_CACHE_DISK_MB", "256")) * 1024 * 1024,
+        )
+    return _variants
+
+
+def parse_size(size):
+    # "512x512" -> (512, 512); anything else means "leave the image alone"
+    if not size:
+        return None
+    try:
+        width, height = (int(part) for part in str(size).lower().split("x"))
+    except ValueError:
+        return None
+    if not (0 < width <= MAX_SIZE and 0 < height <= MAX_SIZE):
+        return None
+    return width, height
+
+
+def sniff_mime_type(data):
+    # What the upstream actually sent; passed-through bytes keep their own type
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    return "image/png"
+
+
+def load_pillow():
+    global _warned
+    try:
+        from PIL import Image
+    except ImportError:
+        if not _warned:
+            _warned = True
+            print("Pillow is not installed; images are returned unchanged", file=sys.stderr)
+        return None
+    try:
+        import pillow_avif  # noqa: F401  registers the AVIF encoder on older Pillow
+    except ImportError:
+        pass
+    Image.init()
+    return Image
+
+
+def resolve_format(output_format, Image):
+    # The requested format, or the nearest one this Pillow build can encode
+    output_format = output_format if output_format in FORMATS else "png"
+    while FORMATS[output_format][1] not in Image.SAVE:
+        output_format = FALLBACKS[output_format]
+    return output_format
+
+
+def encode(image, output_format):
+    _, encoder, quality = FORMATS[output_format]
+    output = io.BytesIO()
+    if output_format == "jpeg":
+        # Progressive scans paint a coarse preview while the rest downloads
+        image.convert("RGB").save(output, encoder, quality=quality, progressive=True, optimize=True)
+    elif output_format == "webp":
+        image.save(output, encoder, quality=quality, method=4)
+    elif output_format == "avif":
+        image.save(output, encoder, quality=quality, speed=6)
+    else:
+        image.save(output, encoder, compress_level=6)
+    return output.getvalue()
+
+
+def render(data, size, output_format, Image):
+    # Fit within size (keeping the aspect ratio) and encode; None when the source already fits as is
+    with Image.open(io.BytesIO(data)) as image:
+        fits = size is None or (image.width <= size[0] and image.height <= size[1])
+        if fits and image.format == FORMATS[output_format][1]:
+            return None
+        if not fits:
+            with stage("resize"):
+                # reducing_gap box-reduces by whole factors first (cheap), then resamples the small remainder
+                image.thumbnail(size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+        with stage("transcode"):
+            return encode(image, output_format)
+
+
+def variant(data, digest, size, output_format, Image, store):
+    # Returns (bytes, blob or None) for data fitted within size in output_format, or
+    # None to use the original; only stored results go to the blob store
+    mime_type = FORMATS[output_format][0]
+    key = make_key(output_format, FORMATS[output_format][2], digest, size)
+    variants = get_variant_cache()
+    cached = variants.get(key, mime_type, store)
+    if cached is not None:
+        return cached
+
+    rendered = render(data, size, output_format, Image)
+    if rendered is None:
+        return None
+    return rendered, variants.set(key, rendered, mime_type, store)
+
+
+def process(data, size=None, thumbnail=False, output_format=None, store=False):
+    # Blocking. Returns {"image": (bytes, mime type, blob or None),
+    # "thumbnail": (bytes, mime type, blob or None) or None}; blobs only when storing
+    result = {"image": (data, sniff_mime_type(data), None), "thumbnail": None}
+    Image = load_pillow()
+    if Image is None:
+        return result
+
+    digest = blobstore.content_hash(data)
+    output_format = resolve_format(output_format, Image)
+    mime_type = FORMATS[output_format][0]
+    try:
+        rendered = variant(data, digest, parse_size(size), output_format, Image, store)
+        if rendered is not None:
+            result["image"] = (rendered[0], mime_type, rendered[1])
+        if thumbnail and THUMBNAIL_SIZE > 0:
+            rendered = variant(data, digest, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), output_format, Image, store)
+            if rendered is not None:
+                result["thumbnail"] = (rendered[0], mime_type, rendered[1])
+    except Exception as e:
+        # Bytes Pillow can't decode (or encode) are still an image the browser may show
+        print(f"Image post-processing failed, returning the original: {e}", file=sys.stderr)
+        return {"image": (data, result["image"][1], None), "thumbnail": None}
+    return result
+
+
+async def transform(data, size=None, thumbnail=False, output_format=None, store=False):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="imaging")
+    # Carry the request's context over so stage timings are still recorded
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, context.run, process, data, size, thumbnail, output_format, store)
@@ -0,0 +1,118 @@
+import os
+import bisect
+
+# Prometheus metrics for one engine process, rendered in the text exposition format
+# by the "metrics" control command. Every sample carries a worker label (the pid)
+# so Node can merge the output of all workers into one scrape.
+#
+# Updates happen on the event loop thread only, so counters are plain dict
+# increments with no locking on the hot path.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_metrics = []
+
+
+def format_labels(names, values):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = ("worker",) + tuple(labels)
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def set(self, *labels, value):
+        # For counts already kept elsewhere (caches, single-flight), copied in at scrape time
+        self.values[labels] = value
+
+    def samples(self, worker):
+        for labels, value in self.values.items():
+            yield self.name, (worker,) + labels, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = ("worker",) + tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self.values = {}
+        _metrics.append(self)
+
+    def observe(self, *labels, value):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self, worker):
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", (worker,) + labels + (format_value(bound),), cumulative
+            yield f"{self.name}_sum", (worker,) + labels, total
+            yield f"{self.name}_count", (worker,) + labels, count
+
+
+def observe_upstream(model, status, seconds):
+    upstream_total.inc(model, str(status))
+    upstream_seconds.observe(model, value=seconds)
+
+
+def render():
+    worker = str(os.getpid())
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples(worker):
+            names = metric.labels + ("le",) if name.endswith("_bucket") else metric.labels
+            lines.append(f"{name}{format_labels(names, labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Requests handled by the engine, by tool and outcome (success, error, timeout, cancelled)
+requests_total = Counter("engine_requests_total", "Engine requests by tool and outcome.", ("tool", "outcome"))
+request_seconds = Histogram("engine_request_duration_seconds", "Engine request latency by tool.", ("tool",))
+upstream_total = Counter(
+    "engine_upstream_requests_total", "Upstream calls by model and HTTP status (error = no response).",
+    ("model", "status"),
+)
+upstream_seconds = Histogram("engine_upstream_duration_seconds", "Upstream call latency by model.", ("model",))
+coalesced_total = Counter("engine_coalesced_requests_total", "Requests that shared another request's upstream call.")
+in_flight = Gauge("engine_in_flight_requests", "Requests accepted and not yet answered.")
+queue_depth = Gauge("engine_queue_depth", "Requests waiting for a free concurrency slot.")
+cache_lookups = Counter("engine_cache_lookups_total", "Response cache lookups by cache and result.", ("cache", "result"))
+cache_hit_ratio = Gauge("engine_cache_hit_ratio", "Share of response cache lookups that were hits.", ("cache",))
+circuit_open = Gauge("engine_circuit_open", "1 while the model's circuit breaker is not closed.", ("model",))
+model_ready = Gauge("engine_model_ready", "1 while the keep-warm pinger sees the model as loaded.", ("model",))
+resident_memory = Gauge("engine_resident_memory_bytes", "Resident set size of the engine process (its peak where /proc is unavailable).")
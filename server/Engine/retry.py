@@ -0,0 +1,91 @@
+import os
+import time
+import random
+import asyncio
+import contextvars
+
+from http_pool import retry_after_seconds
+from breaker import CircuitOpen
+from timings import stage
+
+# Retry policy for upstream calls: jittered exponential backoff, honouring
+# Retry-After and the inference API's estimated_time, within a deadline budget
+MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "4"))
+BASE_DELAY_MS = float(os.environ.get("RETRY_BASE_DELAY_MS", "500"))
+MAX_DELAY_MS = float(os.environ.get("RETRY_MAX_DELAY_MS", "20000"))
+# Total budget when the caller gave no deadline (e.g. one-shot CLI runs)
+DEFAULT_BUDGET_MS = float(os.environ.get("RETRY_BUDGET_MS", "60000"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Absolute time.monotonic() by which the current request must be answered.
+# The engine sets it per request; every task spawned for that request inherits it.
+# Coalesced calls hold a callable instead, returning the latest waiter's deadline.
+deadline = contextvars.ContextVar("deadline", default=None)
+
+
+def set_deadline(deadline_ms):
+    deadline.set(time.monotonic() + deadline_ms / 1000)
+
+
+def time_left(started):
+    # Seconds until the request deadline, or until the default budget runs out
+    current = deadline.get()
+    if callable(current):
+        current = current()
+    if current is None:
+        current = started + DEFAULT_BUDGET_MS / 1000
+    return current - time.monotonic()
+
+
+def backoff_seconds(attempt):
+    # Full jitter: uniform between zero and the exponential ceiling
+    ceiling = min(MAX_DELAY_MS, BASE_DELAY_MS * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling) / 1000
+
+
+async def with_retries(send):
+    # Calls send() until it returns a non-retryable response, attempts run out, or
+    # the next wait would overrun the deadline; the last response or error is returned
+    import httpx
+
+    started = time.monotonic()
+    attempt = 0
+    response = None
+    while True:
+        attempt += 1
+        try:
+            response = await send()
+        except CircuitOpen as e:
+            # The first call fails fast; a retry that finds the circuit open (often because
+            # the previous failure tripped it) waits it out like a Retry-After if the deadline allows.
+            # These waits don't use up attempts; the deadline bounds them.
+            if attempt == 1:
+                raise
+            attempt -= 1
+            if e.probing:
+                # Another worker's probe usually settles long before its timeout, so poll
+                delay = min(e.retry_in, random.uniform(0.5, 1) * BASE_DELAY_MS / 1000)
+            else:
+                delay = e.retry_in + random.uniform(0, 0.25)
+            if delay >= time_left(started):
+                if response is not None:
+                    return response
+                raise
+        except httpx.TransportError:
+            if attempt >= MAX_ATTEMPTS:
+                raise
+            delay = backoff_seconds(attempt)
+            if delay >= time_left(started):
+                raise
+        else:
+            if response.status_code not in RETRYABLE_STATUS or attempt >= MAX_ATTEMPTS:
+                return response
+            # The upstream's own estimate beats our guess, plus a little jitter so waiters spread out
+            requested = retry_after_seconds(response)
+            delay = requested + random.uniform(0, 0.25) if requested is not None else backoff_seconds(attempt)
+            if delay >= time_left(started):
+                return response
+
+        with stage("retry_wait"):
+            await asyncio.sleep(delay)
@@ -0,0 +1,248 @@
+import re
+import time
+import zlib
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain, repeat
+from operator import add, mul
+
+# Near-duplicate prompt cache: "what is photosynthesis" and "explain photosynthesis"
+# share an answer. Prompts are embedded on the CPU with a hashing vectorizer (content
+# words and word pairs, no model to load) and indexed in process with SimHash LSH:
+#   - each prompt gets a bands * band_bits random-hyperplane signature
+#   - the signature is cut into bands; prompts sharing any band are candidates
+#   - candidates are compared by exact cosine similarity against the threshold
+# Buckets keep only their newest BUCKET_ENTRIES ids, so a lookup scores at most
+# bands * BUCKET_ENTRIES candidates however many entries are cached, and there are
+# at most bands * 2 ** band_bits buckets per namespace however many entries there are.
+# Entries are kept compact (arrays, one int signature) so the default cap fits well
+# inside an engine worker's ENGINE_MAX_RSS_MB: about 1.2 KB each plus the answer.
+BUCKET_ENTRIES = 32
+
+# Words that phrase a request rather than carry its topic. Question words are not
+# among them: "when did X start" and "why did X start" want different answers.
+STOPWORDS = frozenset("""
+a an the is are be been being am do does of in on at for by with about as
+and or but if then so that this these those it its i me my we our you your he she they them
+please can could would should may might has have
+tell give show write provide list summarize summarise help know want need
+some any much many more most very really just also there here s
+""".split())
+
+# Requests for an explanation ask what something is
+CANONICAL = {"whats": "what", "explain": "what", "describe": "what", "define": "what"}
+
+# The kind of question outweighs a topic word, so long questions that differ only
+# in it still fall below the threshold
+QUESTION_WORDS = frozenset("what which who whom whose when where why how".split())
+QUESTION_WEIGHT = 2.0
+
+# Tense changes the answer ("who is" vs "who was the president of France"); present is
+# the unmarked default, past and future auxiliaries (and -ed endings) add a marker
+TENSES = {"was": "past", "were": "past", "did": "past", "had": "past", "will": "future", "shall": "future"}
+TENSE_WEIGHT = 2.0
+
+# Prepositions that say which way an operation goes: "celsius to fahrenheit" is not
+# "fahrenheit to celsius", though both use the same words. Each is tied to the next
+# content word as an operand feature.
+DIRECTIONS = frozenset("to from into than".split())
+DIRECTION_WEIGHT = 1.0
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def stem(word):
+    # Light stemming so plurals match their singular
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokens(text):
+    # (content words, markers): markers are the tense and operand features, weighted apart
+    words = []
+    markers = {}
+    direction = None
+    for word in TOKEN_PATTERN.findall(text.casefold()):
+        if word in TENSES:
+            markers[TENSES[word]] = TENSE_WEIGHT
+            continue
+        if word in DIRECTIONS:
+            direction = word
+            continue
+        if word in STOPWORDS:
+            continue
+        word = CANONICAL.get(word, word)
+        # "started" is "start" in the past
+        if len(word) > 5 and word.endswith("ed"):
+            markers["past"] = TENSE_WEIGHT
+            word = word[:-2]
+        word = stem(word)
+        if direction is not None:
+            markers[f"{direction} {word}"] = DIRECTION_WEIGHT
+            direction = None
+        words.append(word)
+    return words, markers
+
+
+def embed(text):
+    # Sparse, L2-normalised vector: {feature hash: weight}
+    words, markers = tokens(text)
+    vector = {}
+    for word in words:
+        feature = zlib.crc32(word.encode("utf-8"))
+        vector[feature] = vector.get(feature, 0.0) + (QUESTION_WEIGHT if word in QUESTION_WORDS else 1.0)
+    # Word pairs keep some of the order ("dog bites man" vs "man bites dog")
+    for first, second in zip(words, words[1:]):
+        feature = zlib.crc32(f"{first} {second}".encode("utf-8"))
+        vector[feature] = vector.get(feature, 0.0) + 0.5
+    # The ~ keeps markers apart from words and word pairs
+    for marker, weight in markers.items():
+        feature = zlib.crc32(f"~{marker}".encode("utf-8"))
+        vector[feature] = vector.get(feature, 0.0) + weight
+    norm = sum(weight * weight for weight in vector.values()) ** 0.5
+    if norm:
+        for feature in vector:
+            vector[feature] /= norm
+    return vector
+
+
+def cosine(first, second):
+    if len(first) > len(second):
+        first, second = second, first
+    return sum(weight * second.get(feature, 0.0) for feature, weight in first.items())
+
+
+def packed_cosine(vector, features, weights):
+    # Against a stored vector; map() keeps the multiply-add in C
+    return sum(map(mul, weights, map(vector.get, features, repeat(0.0))))
+
+
+# Each byte of a hyperplane bitmask as +/-1 signs, lowest bit first
+BYTE_SIGNS = tuple(tuple(1.0 if byte >> bit & 1 else -1.0 for bit in range(8)) for byte in range(256))
+
+
+@lru_cache(maxsize=8192)
+def hyperplanes(feature, bits):
+    # Deterministic pseudo-random bitmask: bit i set means +1 on hyperplane i, else -1
+    digest = hashlib.blake2b(feature.to_bytes(4, "little"), digest_size=bits // 8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def signature(vector, bits):
+    # map() keeps the per-bit arithmetic in C
+    sums = [0.0] * bits
+    for feature, weight in vector.items():
+        planes = hyperplanes(feature, bits).to_bytes(bits // 8, "little")
+        signs = chain.from_iterable(map(BYTE_SIGNS.__getitem__, planes))
+        sums = list(map(add, sums, map(mul, signs, repeat(weight))))
+    return int("".join("1" if total > 0 else "0" for total in reversed(sums)), 2)
+
+
+class SemanticCache:
+    def __init__(self, threshold=0.9, ttl_seconds=86400, max_entries=20_000, bands=16, band_bits=12):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bands = bands
+        self.band_bits = band_bits
+        # Signatures are whole bytes for blake2b
+        self.bits = -(-bands * band_bits // 8) * 8
+        # id -> (namespace, feature hashes, weights, signature, expires_at, value), least
+        # recently used first; vectors are stored as an array("I") and an array("f")
+        self.entries = OrderedDict()
+        # namespace -> {band key: newest entry ids}; band keys are the band's bits tagged with its index
+        self.buckets = {}
+        # One shared object per namespace rather than one per entry
+        self.namespaces = {}
+        self.next_id = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self.lock = threading.Lock()
+
+    def band_keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [band << self.band_bits | value >> (band * self.band_bits) & mask for band in range(self.bands)]
+
+    def get(self, namespace, text):
+        # Returns (value, similarity) of the closest live entry within the threshold, or None
+        vector = embed(text)
+        if not vector:
+            return None
+        keys = self.band_keys(signature(vector, self.bits))
+        now = time.time()
+        with self.lock:
+            best, best_id, best_similarity = None, None, self.threshold
+            expired = []
+            seen = set()
+            buckets = self.buckets.get(namespace, {})
+            for key in keys:
+                for entry_id in buckets.get(key, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    entry = self.entries[entry_id]
+                    if entry[4] <= now:
+                        expired.append(entry_id)
+                        continue
+                    similarity = packed_cosine(vector, entry[1], entry[2])
+                    if similarity >= best_similarity:
+                        best, best_id, best_similarity = entry, entry_id, similarity
+            for entry_id in expired:
+                self.remove(entry_id)
+                self.counters["expired"] += 1
+
+            if best is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(best_id)
+            self.counters["hits"] += 1
+            return best[5], best_similarity
+
+    def set(self, namespace, text, value, ttl_seconds=None):
+        vector = embed(text)
+        if not vector:
+            return
+        value_signature = signature(vector, self.bits)
+        features, weights = array("I", vector.keys()), array("f", vector.values())
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self.lock:
+            namespace = self.namespaces.setdefault(namespace, namespace)
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = (namespace, features, weights, value_signature, expires_at, value)
+            buckets = self.buckets.setdefault(namespace, {})
+            for key in self.band_keys(value_signature):
+                bucket = buckets.setdefault(key, [])
+                bucket.append(entry_id)
+                if len(bucket) > BUCKET_ENTRIES:
+                    del bucket[0]
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+
+    def remove(self, entry_id):
+        namespace, _, _, value_signature, _, _ = self.entries.pop(entry_id)
+        buckets = self.buckets[namespace]
+        for key in self.band_keys(value_signature):
+            bucket = buckets.get(key)
+            if bucket is None:
+                continue
+            if entry_id in bucket:
+                bucket.remove(entry_id)
+            if not bucket:
+                del buckets[key]
+        if not buckets:
+            del self.buckets[namespace]
+            del self.namespaces[namespace]
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self.entries),
+            "buckets": sum(len(buckets) for buckets in self.buckets.values()),
+        }
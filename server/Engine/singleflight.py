@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+
+import retry
+import timings
+
+
+class Flight:
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        # Latest absolute deadline among the waiters, None while none has one
+        self.deadline = None
+        # Stages of the shared call, copied into each waiter's own timings
+        self.recorded = {}
+
+    def join(self, deadline):
+        if deadline is not None and (self.deadline is None or deadline > self.deadline):
+            self.deadline = deadline
+
+    def current_deadline(self):
+        return self.deadline
+
+
+class SingleFlight:
+    # Coalesces concurrent calls with the same key onto one upstream call whose
+    # result is fanned out to every waiter.
+    # The shared call runs in a fresh context rather than the first caller's: its
+    # retries follow the latest deadline among the waiters (each waiter still gives
+    # up at its own), and its stages are recorded once and added to every waiter's
+    # timings in full, including any part that ran before a follower joined.
+
+    def __init__(self):
+        self.flights = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key, fn):
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = Flight()
+            context = contextvars.Context()
+            context.run(retry.deadline.set, flight.current_deadline)
+            context.run(timings.recorder.set, flight.recorded)
+            flight.task = context.run(asyncio.ensure_future, fn())
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self.forget(key, flight))
+            self.counters["leaders"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        flight.join(retry.deadline.get())
+
+        flight.waiters += 1
+        try:
+            # Shield the shared call so one waiter hitting its deadline doesn't cancel the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+            recorded = timings.recorder.get()
+            if recorded is not None and flight.task.done():
+                for name, ms in flight.recorded.items():
+                    recorded[name] = recorded.get(name, 0.0) + ms
+
+    def forget(self, key, flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self):
+        return {
+            **self.counters,
+            "in_flight": len(self.flights),
+            "waiters": sum(flight.waiters for flight in self.flights.values()),
+        }
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from config import ENGINE_DIR
+
+# Cold-start tooling for the engine entry points:
+#   python3 startup.py report [text image voice]   -X importtime breakdown per module
+#   python3 startup.py check --budget-ms 250       exit 1 if any cold start (up to a built HTTP client) is over budget
+#   python3 startup.py record                      append cold-start and warm-path numbers to the history
+#   python3 startup.py compare --threshold 0.2     exit 1 if the latest record regressed
+ENTRY_POINTS = ["text", "image", "voice"]
+DEFAULT_BUDGET_MS = float(os.environ.get("ENGINE_STARTUP_BUDGET_MS", "250"))
+# One JSON record per line, meant to be committed so the numbers are tracked over time
+HISTORY_PATH = os.environ.get("ENGINE_STARTUP_HISTORY", os.path.join(ENGINE_DIR, "startup-history.jsonl"))
+
+# Runs in a fresh interpreter and times each cold-start stage of one entry point
+STAGES_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import config
+loaded = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from http_pool import get_client
+get_client({module}.API_URL)
+built = time.perf_counter()
+print(json.dumps({{
+    "dotenv_ms": (loaded - started) * 1000,
+    "import_ms": (imported - loaded) * 1000,
+    "client_ms": (built - imported) * 1000,
+}}))
+"""
+
+
+def run_python(args, extra_env=None):
+    env = {**os.environ, **(extra_env or {})}
+    return subprocess.run(
+        [sys.executable, *args], cwd=ENGINE_DIR, env=env,
+        capture_output=True, text=True,
+    )
+
+
+def import_times(module):
+    # Parse "import time: self [us] | cumulative | imported package" lines
+    completed = run_python(["-X", "importtime", "-c", f"import {module}"])
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return rows
+
+
+def cold_start_stages(module, runs=5):
+    # Median per stage; "interpreter_ms" is whatever the process spent outside the
+    # timed stages (interpreter start-up, site imports and shutdown)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = run_python(["-c", STAGES_SCRIPT.format(module=module)])
+        wall_ms = (time.perf_counter() - started) * 1000
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "run failed")
+        stages = json.loads(completed.stdout.strip().splitlines()[-1])
+        stages["interpreter_ms"] = wall_ms - sum(stages.values())
+        stages["total_ms"] = wall_ms
+        samples.append(stages)
+    return {stage: round(statistics.median(sample[stage] for sample in samples), 2) for stage in samples[0]}
+
+
+def warm_path(modules, requests):
+    # Sequential requests to one long-lived engine per entry point, against a
+    # zero-latency stub so only the engine's own overhead is measured
+    import asyncio
+    import argparse
+    import tempfile
+    import bench
+
+    options = argparse.Namespace(requests=requests, concurrency=1, distinct=requests)
+    stub_args = ["--text-latency", "fixed:0", "--image-latency", "fixed:0", "--voice-latency", "fixed:0",
+                 "--token-ms", "0", "--seed", "1"]
+    stub, stub_url = bench.start_stub(stub_args)
+
+    async def run_all():
+        results = {}
+        with tempfile.TemporaryDirectory(prefix="engine-startup-") as workdir:
+            for module in modules:
+                result = await bench.run_mode(module, options, stub_url, workdir)
+                results[module] = {
+                    "p50_ms": result["latency_ms"]["p50"],
+                    "p95_ms": result["latency_ms"]["p95"],
+                    "errors": result["errors"],
+                }
+        return results
+
+    try:
+        return asyncio.run(run_all())
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+def git_revision():
+    completed = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=ENGINE_DIR, capture_output=True, text=True,
+    )
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+
+def record(modules, runs, requests, warm, history_path):
+    entry = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "cold": {},
+    }
+    for module in modules:
+        try:
+            entry["cold"][module] = cold_start_stages(module, runs)
+        except RuntimeError as e:
+            entry["cold"][module] = {"error": str(e)}
+    if warm:
+        entry["warm"] = warm_path(modules, requests)
+
+    with open(history_path, "a", encoding="utf-8") as history:
+        history.write(json.dumps(entry) + "\n")
+    print(json.dumps(entry, indent=2))
+    return 0
+
+
+def read_history(history_path):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, encoding="utf-8") as history:
+        return [json.loads(line) for line in history if line.strip()]
+
+
+def flatten(entry):
+    # {"cold.text.total_ms": 182.3, "warm.image.p50_ms": 4.1, ...}
+    metrics = {}
+    for section in ("cold", "warm"):
+        for module, values in entry.get(section, {}).items():
+            for name, value in values.items():
+                if name.endswith("_ms") and isinstance(value, (int, float)):
+                    metrics[f"{section}.{module}.{name}"] = value
+    return metrics
+
+
+def compare(history_path, baseline_runs, threshold, min_delta_ms):
+    # The latest record against the median of the ones before it
+    history = read_history(history_path)
+    if len(history) < 2:
+        print(f"Need at least two records in {history_path} to compare")
+        return 0
+
+    latest = flatten(history[-1])
+    baseline_entries = [flatten(entry) for entry in history[-1 - baseline_runs:-1]]
+    regressions = []
+    for name, value in latest.items():
+        previous = [entry[name] for entry in baseline_entries if name in entry]
+        if not previous:
+            continue
+        baseline = statistics.median(previous)
+        change = (value - baseline) / baseline if baseline else 0.0
+        regressed = change > threshold and value - baseline > min_delta_ms
+        print(f"{'REGRESSION' if regressed else 'ok':<10} {name:<28} {baseline:9.1f} -> {value:9.1f} ms ({change:+.0%})")
+        if regressed:
+            regressions.append(name)
+
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed more than {threshold:.0%} against the last {len(baseline_entries)} record(s)")
+        return 1
+    return 0
+
+
+def report(modules, top):
+    for module in modules:
+        try:
+            rows = import_times(module)
+        except RuntimeError as e:
+            print(f"{module}: {e}")
+            continue
+        # Only top-level rows are counted so nested imports aren't added twice
+        total = sum(row["cumulative_ms"] for row in rows if row["depth"] == 1)
+        print(f"{module}: {total:.1f} ms importing")
+        for row in sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]:
+            print(f"  {row['cumulative_ms']:8.1f} ms  {row['self_ms']:7.1f} ms self  {row['module']}")
+
+
+def check(modules, budget_ms, runs):
+    # Gates on the same stages record measures: httpx is imported and the client built
+    # on the first request, so a cold start isn't over until that has happened too
+    results = {}
+    over_budget = False
+    for module in modules:
+        try:
+            stages = cold_start_stages(module, runs)
+        except RuntimeError as e:
+            results[module] = {"error": str(e)}
+            over_budget = True
+            continue
+        elapsed = stages["total_ms"]
+        results[module] = {**stages, "budget_ms": budget_ms}
+        if elapsed > budget_ms:
+            over_budget = True
+    print(json.dumps(results, indent=2))
+    return 1 if over_budget else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Engine cold-start and warm-path measurements")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = subcommands.add_parser("report", help="show the slowest imports of each entry point")
+    report_parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    report_parser.add_argument("--top", type=int, default=15)
+
+    check_parser = subcommands.add_parser("check", help="fail if a cold start exceeds the budget")
+    check_parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    check_parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    check_parser.add_argument("--runs", type=int, default=5)
+
+    record_parser = subcommands.add_parser("record", help="append cold-start and warm-path numbers to the history")
+    record_parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    record_parser.add_argument("--runs", type=int, default=5)
+    record_parser.add_argument("--requests", type=int, default=50, help="warm requests per entry point")
+    record_parser.add_argument("--no-warm", dest="warm", action="store_false", help="only measure cold starts")
+    record_parser.add_argument("--history", default=HISTORY_PATH)
+
+    compare_parser = subcommands.add_parser("compare", help="fail if the latest record regressed")
+    compare_parser.add_argument("--history", default=HISTORY_PATH)
+    compare_parser.add_argument("--baseline", type=int, default=5, help="earlier records to take the median of")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, e.g. 0.2 for 20%%")
+    compare_parser.add_argument("--min-delta-ms", type=float, default=5, help="ignore smaller absolute changes")
+
+    options = parser.parse_args()
+    if options.command == "report":
+        report(options.modules, options.top)
+        return 0
+    if options.command == "record":
+        return record(options.modules, options.runs, options.requests, options.warm, options.history)
+    if options.command == "compare":
+        return compare(options.history, options.baseline, options.threshold, options.min_delta_ms)
+    return check(options.modules, options.budget_ms, options.runs)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import sys
+import json
+import math
+import time
+import random
+import zlib
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from audio import build_wav
+from image import MODEL as IMAGE_MODEL
+from voice import MODEL as VOICE_MODEL
+
+# Local stand-in for the Hugging Face endpoints the engines call, for offline benchmarks:
+#   POST /v1/chat/completions      router chat completions (JSON or "stream": true SSE)
+#   POST /models/<image model>     image bytes
+#   POST /models/<voice model>     WAV audio
+#   GET  /stats                    requests served, by endpoint and status
+# Latency specs are "fixed:MS", "uniform:LOW_MS:HIGH_MS" or "lognormal:MEDIAN_MS:SIGMA".
+# Point the engines at it with HF_ROUTER_URL / HF_INFERENCE_URL (bench.py does this).
+
+# 16-bit mono 24 kHz PCM, Kokoro's output format
+WAV_FORMAT = struct.pack("<HHIIHH", 1, 1, 24000, 48000, 2, 16)
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def build_png(size):
+    # A decodable RGB PNG of random noise (incompressible) of roughly size bytes
+    side = max(1, int((size / 3) ** 0.5))
+    raw = b"".join(b"\0" + random.randbytes(side * 3) for _ in range(side))
+
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+    header = struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0)
+    return PNG_SIGNATURE + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+def parse_latency(spec):
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(":")] if params else []
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise argparse.ArgumentTypeError(f"Invalid latency spec: {spec}")
+
+
+class Stub:
+    def __init__(self, options):
+        self.options = options
+        self.latency = {
+            "text": options.text_latency,
+            "image": options.image_latency,
+            "voice": options.voice_latency,
+        }
+        self.image = build_png(options.image_bytes)
+        self.audio = build_wav(WAV_FORMAT, bytes(options.voice_bytes - options.voice_bytes % 2))
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, endpoint, status):
+        key = f"{endpoint} {status}"
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def injected_error(self):
+        # Returns (status, headers, body) for an injected failure, or None
+        roll = random.random()
+        if roll < self.options.rate_503:
+            body = {"error": "Model is currently loading", "estimated_time": self.options.estimated_time}
+            return 503, {}, body
+        if roll < self.options.rate_503 + self.options.rate_429:
+            return 429, {"Retry-After": str(self.options.retry_after)}, {"error": "Rate limit reached"}
+        return None
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; with Nagle's algorithm on, the body waits
+        # for the client's delayed ACK (~40 ms) on every keep-alive response
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def send(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_json(self, status, value, headers=None):
+            self.send(status, json.dumps(value).encode("utf-8"), "application/json", headers)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with stub.lock:
+                    self.send_json(200, stub.counts)
+                return
+            self.send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path == "/v1/chat/completions":
+                endpoint = "text"
+            elif self.path == f"/models/{IMAGE_MODEL}":
+                endpoint = "image"
+            elif self.path == f"/models/{VOICE_MODEL}":
+                endpoint = "voice"
+            else:
+                self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+                return
+
+            time.sleep(stub.latency[endpoint]() / 1000)
+            failure = stub.injected_error()
+            if failure is not None:
+                status, headers, error = failure
+                stub.count(endpoint, status)
+                self.send_json(status, error, headers)
+                return
+
+            stub.count(endpoint, 200)
+            if endpoint == "image":
+                self.send(200, stub.image, "image/png")
+            elif endpoint == "voice":
+                self.send(200, stub.audio, "audio/wav")
+            elif json.loads(body or b"{}").get("stream"):
+                self.stream_completion()
+            else:
+                content = " ".join(["token"] * stub.options.text_tokens)
+                self.send_json(200, {"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+        def stream_completion(self):
+            # Server-sent events, one chunk per token, then [DONE]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index in range(stub.options.text_tokens):
+                if index:
+                    time.sleep(stub.options.token_ms / 1000)
+                chunk = {"choices": [{"delta": {"content": "token "}}]}
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+
+        def write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stub of the Hugging Face endpoints used by the engines")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    parser.add_argument("--text-latency", type=parse_latency, default="lognormal:600:0.4")
+    parser.add_argument("--image-latency", type=parse_latency, default="lognormal:2500:0.3")
+    parser.add_argument("--voice-latency", type=parse_latency, default="lognormal:1200:0.4")
+    parser.add_argument("--text-tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=10, help="gap between streamed tokens")
+    parser.add_argument("--image-bytes", type=int, default=1_200_000)
+    parser.add_argument("--voice-bytes", type=int, default=480_000)
+    parser.add_argument("--rate-503", type=float, default=0.0, help="share of calls answered 503 (model loading)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of calls answered 429 (rate limited)")
+    parser.add_argument("--estimated-time", type=float, default=2.0, help="estimated_time sent with 503s")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with 429s")
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.seed is not None:
+        random.seed(options.seed)
+
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(Stub(options)))
+    server.daemon_threads = True
+    # The first line tells the caller where to connect
+    print(f"http://{options.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
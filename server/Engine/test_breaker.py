@@ -0,0 +1,59 @@
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+
+import breaker
+from breaker import CircuitBreaker, CircuitOpen, guarded
+
+NAME = "test/model"
+
+
+class CancelledProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.breaker = CircuitBreaker(os.path.join(self.directory.name, "breaker.sqlite3"))
+        breaker._breaker = self.breaker
+
+    def tearDown(self):
+        breaker._breaker = None
+        self.breaker.db.close()
+        self.directory.cleanup()
+
+    def cancel_call(self):
+        async def hang():
+            await asyncio.sleep(60)
+
+        async def run():
+            task = asyncio.ensure_future(guarded(NAME, hang))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+
+    def test_cancelled_probe_hands_the_probe_on(self):
+        # Cool-down over: the next call becomes the half-open probe
+        self.breaker.set_state(NAME, "open", time.time() - 1)
+        self.cancel_call()
+        self.assertEqual(self.breaker.state(NAME)[0], "open")
+        self.assertIsNotNone(self.breaker.check(NAME))
+        self.assertEqual(self.breaker.state(NAME)[0], "half_open")
+
+    def test_other_callers_wait_while_a_probe_runs(self):
+        self.breaker.set_state(NAME, "open", time.time() - 1)
+        self.breaker.check(NAME)
+        with self.assertRaises(CircuitOpen) as raised:
+            self.breaker.check(NAME)
+        self.assertTrue(raised.exception.probing)
+
+    def test_cancelled_call_leaves_a_closed_circuit_alone(self):
+        self.cancel_call()
+        self.assertEqual(self.breaker.state(NAME)[0], "closed")
+        self.assertEqual(self.breaker.stats(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from semantic_cache import SemanticCache, cosine, embed
+
+THRESHOLD = 0.9
+
+# Rephrasings that should share an answer
+SAME = [
+    ("what is photosynthesis", "explain photosynthesis"),
+    ("What's photosynthesis?", "Please define photosynthesis"),
+    ("Tell me when World War 2 started", "When was it that World War 2 started?"),
+    ("When did World War 2 start", "When was it that World War 2 started?"),
+    ("convert celsius to fahrenheit in python", "Can you convert Celsius to Fahrenheit in Python?"),
+]
+
+# Different questions about the same topic; serving one's answer for the other is wrong
+DIFFERENT = [
+    ("When did World War 2 start", "Why did World War 2 start"),
+    ("where is paris", "what is paris"),
+    ("who wrote hamlet", "when was hamlet written"),
+    ("how do vaccines work", "why do vaccines work"),
+    (
+        "When did the French revolution begin and what were its main political causes",
+        "Why did the French revolution begin and what were its main political causes",
+    ),
+    # Tense changes the answer
+    ("who is the president of france", "who was the president of france"),
+    ("what is the population of tokyo", "what will the population of tokyo be"),
+    # So does the order of the operands
+    ("convert celsius to fahrenheit in python", "convert fahrenheit to celsius in python"),
+    ("how to convert from celsius to fahrenheit", "how to convert from fahrenheit to celsius"),
+    ("translate english into french", "translate french into english"),
+]
+
+
+class SemanticCacheTest(unittest.TestCase):
+    def test_rephrasings_reach_the_threshold(self):
+        for first, second in SAME:
+            with self.subTest(first=first, second=second):
+                self.assertGreaterEqual(cosine(embed(first), embed(second)), THRESHOLD)
+
+    def test_different_questions_stay_below_the_threshold(self):
+        for first, second in DIFFERENT:
+            with self.subTest(first=first, second=second):
+                self.assertLess(cosine(embed(first), embed(second)), THRESHOLD)
+
+    def test_cache_does_not_answer_a_different_question(self):
+        cache = SemanticCache(threshold=THRESHOLD)
+        for first, _ in DIFFERENT:
+            cache.set("text", first, first)
+        for first, second in DIFFERENT:
+            with self.subTest(second=second):
+                match = cache.get("text", second)
+                self.assertTrue(match is None or match[0] == second)
+
+    def test_cache_answers_a_rephrasing(self):
+        cache = SemanticCache(threshold=THRESHOLD)
+        cache.set("text", "what is photosynthesis", "answer")
+        value, similarity = cache.get("text", "explain photosynthesis")
+        self.assertEqual(value, "answer")
+        self.assertGreaterEqual(similarity, THRESHOLD)
+
+
+if __name__ == "__main__":
+    unittest.main()
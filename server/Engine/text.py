@@ -1,94 +1,298 @@
 import os
-import requests
-import dotenv
 import sys
 import json
+import time
+import asyncio
+from config import ROUTER_URL, get_api_key
+from http_pool import get_client, close_all
+from cache import ResponseCache, make_key
+from breaker import CircuitOpen, guarded, get_breaker, is_failure
+from retry import with_retries
+from timings import stage
+from metrics import observe_upstream
 
-# Load environment variables
-dotenv.load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
+API_URL = f"{ROUTER_URL}/v1/chat/completions"
+MODEL = "openai/gpt-oss-20b:fireworks-ai"
 
-# Check if API key exists
-api_key = os.environ.get('HUGGINGFACE_API_KEY')
-if not api_key:
-    error_result = {
-        "success": False,
-        "error": "HUGGINGFACE_API_KEY environment variable not found"
-    }
-    print(json.dumps(error_result))
-    sys.exit(1)
+# Bump whenever build_prompt changes so cached answers for the old template are not served
+TEMPLATE_VERSION = 1
 
-API_URL = "https://router.huggingface.co/v1/chat/completions"
-headers = {
-    "Authorization": f"Bearer {api_key}",
-}
+# Exact-match cache of successful completions
+CACHE_ENABLED = os.environ.get("TEXT_CACHE_ENABLED", "true").lower() == "true"
+_cache = None
 
-def query(payload):
-    try:
-        response = requests.post(API_URL, headers=headers, json=payload)
-        response.raise_for_status()  # Raises an exception for bad status codes
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        error_result = {
-            "success": False,
-            "error": f"Request failed: {str(e)}"
-        }
-        print(json.dumps(error_result))
-        sys.exit(1)
-    except Exception as e:
-        error_result = {
-            "success": False,
-            "error": f"Unexpected error: {str(e)}"
-        }
-        print(json.dumps(error_result))
-        sys.exit(1)
 
-# Get prompt from command line argument or stdin
-if len(sys.argv) > 1:
-    user_input = " ".join(sys.argv[1:])
-else:
-    user_input = input("What would you like to ask the AI? \n")
+def get_cache():
+    global _cache
+    if _cache is None and CACHE_ENABLED:
+        _cache = ResponseCache(
+            "text",
+            ttl_seconds=int(os.environ.get("TEXT_CACHE_TTL_SECONDS", "86400")),
+            memory_entries=int(os.environ.get("TEXT_CACHE_MEMORY_ENTRIES", "1024")),
+            disk_bytes=int(os.environ.get("TEXT_CACHE_DISK_MB", "256")) * 1024 * 1024,
+        )
+    return _cache
+
+
+# Optional near-duplicate cache consulted after an exact miss (see semantic_cache.py)
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+_semantic_cache = None
+
+
+def get_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+        from semantic_cache import SemanticCache
+
+        _semantic_cache = SemanticCache(
+            threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+            ttl_seconds=int(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", "86400")),
+            max_entries=int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "20000")),
+        )
+    return _semantic_cache
+
+
+def normalize_prompt(user_input):
+    # Case and whitespace differences don't change the answer
+    return " ".join(user_input.split()).casefold()
+
 
-# Create a prompt template that encourages paragraph responses
-prompt_template = f"""You are a text generator agent, Please provide a clear, well-structured paragraph response to the following question. Focus on giving a comprehensive answer in flowing paragraph format without bullet points or lists:
+def cache_key(user_input, max_tokens):
+    return make_key(normalize_prompt(user_input), MODEL, TEMPLATE_VERSION, max_tokens)
+
+
+def cached_result(user_input, max_tokens, key):
+    # An exact match first, then a close enough rephrasing of an earlier prompt
+    cache = get_cache()
+    if cache is not None:
+        with stage("cache"):
+            cached = cache.get(key)
+        if cached is not None:
+            return {**cached, "prompt": user_input, "cached": True}
+
+    semantic_cache = get_semantic_cache()
+    if semantic_cache is not None:
+        with stage("semantic_cache"):
+            match = semantic_cache.get((MODEL, TEMPLATE_VERSION, max_tokens), user_input)
+        if match is not None:
+            cached, similarity = match
+            return {**cached, "prompt": user_input, "cached": True, "similarity": round(similarity, 4)}
+    return None
+
+
+def remember_result(user_input, max_tokens, key, result):
+    cache = get_cache()
+    if cache is not None:
+        with stage("cache"):
+            cache.set(key, result)
+    semantic_cache = get_semantic_cache()
+    if semantic_cache is not None:
+        with stage("semantic_cache"):
+            semantic_cache.set((MODEL, TEMPLATE_VERSION, max_tokens), user_input, result)
+
+
+def build_prompt(user_input):
+    # Create a prompt template that encourages paragraph responses
+    return f"""You are a text generator agent, Please provide a clear, well-structured paragraph response to the following question. Focus on giving a comprehensive answer in flowing paragraph format without bullet points or lists:
 
 {user_input}"""
 
-try:
-    response = query({
+
+def build_payload(user_input, stream=False):
+    # max_tokens is only part of the cache key: the model has never been capped, and
+    # reasoning tokens count toward the limit, so a cap could cut answers short
+    payload = {
         "messages": [
             {
                 "role": "user",
-                "content": prompt_template
+                "content": build_prompt(user_input)
             }
         ],
-        "model": "openai/gpt-oss-20b:fireworks-ai"
-        
-    })
+        "model": MODEL
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+async def query(payload, api_key):
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+    response = await with_retries(
+        lambda: guarded(MODEL, lambda: get_client(API_URL).post(API_URL, headers=headers, json=payload))
+    )
+    response.raise_for_status()  # Raises an exception for bad status codes
+    return response.json()
+
+
+async def generate_text(user_input, max_tokens=None):
+    # Check if API key exists
+    api_key = get_api_key()
+    if not api_key:
+        return {
+            "success": False,
+            "error": "HUGGINGFACE_API_KEY environment variable not found"
+        }
+
+    key = cache_key(user_input, max_tokens)
+    cached = cached_result(user_input, max_tokens, key)
+    if cached is not None:
+        return cached
+
+    # Imported only on a cache miss so cached answers never pay for httpx
+    import httpx
+
+    try:
+        response = await query(build_payload(user_input), api_key)
+    except CircuitOpen as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    except httpx.HTTPError as e:
+        return {
+            "success": False,
+            "error": f"Request failed: {str(e)}"
+        }
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": f"Unexpected error: {str(e)}"
+        }
 
     # Extract only the content from the response
     try:
         content = response["choices"][0]["message"]["content"]
-        
-        # Return JSON response for Node.js integration
-        result = {
-            "success": True,
-            "content": content,
-            "prompt": user_input
-        }
-        print(json.dumps(result))
-        
-    except KeyError as e:
-        error_result = {
+    except (KeyError, IndexError, TypeError) as e:
+        return {
             "success": False,
             "error": f"Error extracting response: {e}",
             "response": response
         }
-        print(json.dumps(error_result))
 
-except Exception as e:
-    error_result = {
-        "success": False,
-        "error": f"Script execution error: {str(e)}"
+    result = {
+        "success": True,
+        "content": content,
+        "prompt": user_input
+    }
+    remember_result(user_input, max_tokens, key, result)
+    return result
+
+
+async def stream_text(user_input, max_tokens=None):
+    # Yields {"event": "delta", "content": ...} as tokens arrive, then the final result
+    api_key = get_api_key()
+    if not api_key:
+        yield {
+            "success": False,
+            "error": "HUGGINGFACE_API_KEY environment variable not found"
+        }
+        return
+
+    key = cache_key(user_input, max_tokens)
+    cached = cached_result(user_input, max_tokens, key)
+    if cached is not None:
+        yield {"event": "delta", "content": cached["content"]}
+        yield cached
+        return
+
+    import httpx
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+    parts = []
+    breaker = get_breaker()
+    started = time.monotonic()
+    recorded = False
+    claim = None
+    try:
+        claim = breaker.check(MODEL)
+        client = get_client(API_URL)
+        async with client.stream("POST", API_URL, headers=headers, json=build_payload(user_input, stream=True)) as response:
+            # Time to first byte is what the breaker tracks for streams
+            breaker.record(MODEL, not is_failure(response.status_code), (time.monotonic() - started) * 1000)
+            observe_upstream(MODEL, response.status_code, time.monotonic() - started)
+            recorded = True
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", "replace")
+                yield {
+                    "success": False,
+                    "error": f"Request failed: API Error {response.status_code}: {body[:200]}"
+                }
+                return
+
+            # Server-sent events: "data: {chunk}" lines terminated by "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta") or {}
+                except (ValueError, KeyError, IndexError, TypeError):
+                    continue
+                content = delta.get("content")
+                if content:
+                    parts.append(content)
+                    yield {"event": "delta", "content": content}
+    except CircuitOpen as e:
+        yield {
+            "success": False,
+            "error": str(e)
+        }
+        return
+    except httpx.HTTPError as e:
+        if not recorded:
+            breaker.record(MODEL, False, (time.monotonic() - started) * 1000)
+            observe_upstream(MODEL, "error", time.monotonic() - started)
+        yield {
+            "success": False,
+            "error": f"Request failed: {str(e)}"
+        }
+        return
+    except BaseException:
+        # Cancelled or closed (deadline, client disconnect) before the upstream answered
+        if not recorded:
+            breaker.release(MODEL, claim)
+        raise
+
+    result = {
+        "success": True,
+        "content": "".join(parts),
+        "prompt": user_input
     }
-    print(json.dumps(error_result))
-    sys.exit(1)
+    if parts:
+        remember_result(user_input, max_tokens, key, result)
+    yield result
+
+
+async def main(user_input):
+    try:
+        return await generate_text(user_input)
+    finally:
+        await close_all()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--batch"]:
+        import batch
+        sys.exit(batch.main(
+            sys.argv[1:], "Generate text for every prompt in a JSONL file",
+            lambda record, options: generate_text(record["prompt"], record.get("max_tokens")),
+            "prompt",
+        ))
+
+    # Get prompt from command line argument or stdin
+    if len(sys.argv) > 1:
+        user_input = " ".join(sys.argv[1:])
+    else:
+        user_input = input("What would you like to ask the AI? \n")
+
+    # Return JSON response for Node.js integration
+    result = asyncio.run(main(user_input))
+    print(json.dumps(result))
+    if not result["success"]:
+        sys.exit(1)
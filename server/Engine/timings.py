@@ -0,0 +1,32 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Per-request stage timings in milliseconds, measured with the monotonic perf counter.
+# The engine starts a recorder for requests that ask for timings; every task and
+# thread spawned for the request inherits it, and stages that run more than once
+# (retries, sentence chunks) add up. Without a recorder, stage() costs nothing.
+recorder = contextvars.ContextVar("timings", default=None)
+
+
+def start():
+    recorded = {}
+    recorder.set(recorded)
+    return recorded
+
+
+@contextmanager
+def stage(name):
+    recorded = recorder.get()
+    if recorded is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorded[name] = recorded.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def rounded(recorded):
+    return {name: round(ms, 2) for name, ms in recorded.items()}
@@ -0,0 +1,127 @@
+import os
+import sys
+import shutil
+import asyncio
+
+from cache import make_key
+from timings import stage
+from variants import VariantCache
+import blobstore
+
+# Compressed audio for synthesized speech: Kokoro answers with 24 kHz PCM WAV, about
+# ten times the size of the same speech as Opus. Audio is piped through ffmpeg, which
+# encodes while it is still being fed, so no temporary files are involved. Without
+# ffmpeg on the PATH (or FFMPEG_PATH) the audio is passed through unchanged.
+# Encoded variants are remembered per (source hash, format, bitrate) in a
+# VariantCache (see variants.py), so repeated audio is encoded once.
+FFMPEG = os.environ.get("FFMPEG_PATH", "ffmpeg")
+OPUS_BITRATE = os.environ.get("VOICE_OPUS_BITRATE", "32k")
+MP3_BITRATE = os.environ.get("VOICE_MP3_BITRATE", "64k")
+READ_SIZE = 64 * 1024
+
+# format -> (mime type, ffmpeg output options); "voip" tunes Opus for speech
+FORMATS = {
+    "opus": ("audio/ogg", ["-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip", "-f", "ogg"]),
+    "webm": ("audio/webm", ["-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip", "-f", "webm"]),
+    "mp3": ("audio/mpeg", ["-c:a", "libmp3lame", "-b:a", MP3_BITRATE, "-f", "mp3"]),
+    "wav": ("audio/wav", None),
+}
+
+_variants = None
+_ffmpeg = None
+_warned = False
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def get_variant_cache():
+    global _variants
+    if _variants is None:
+        _variants = VariantCache(
+            "audio_variants",
+            ttl_seconds=int(os.environ.get("VOICE_VARIANT_TTL_SECONDS", "2592000")),
+            memory_entries=int(os.environ.get("VOICE_VARIANT_CACHE_MEMORY_ENTRIES", "64")),
+            disk_bytes=int(os.environ.get("VOICE_VARIANT_CACHE_DISK_MB", "256")) * 1024 * 1024,
+        )
+    return _variants
+
+
+def find_ffmpeg():
+    global _ffmpeg, _warned
+    if _ffmpeg is None:
+        _ffmpeg = shutil.which(FFMPEG) or ""
+        if not _ffmpeg and not _warned:
+            _warned = True
+            print(f"{FFMPEG} not found; audio is returned without transcoding", file=sys.stderr)
+    return _ffmpeg
+
+
+async def encode_stream(data, output_format):
+    # Yields encoded audio as ffmpeg produces it while a task feeds it the source
+    process = await asyncio.create_subprocess_exec(
+        find_ffmpeg(), "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-vn",
+        *FORMATS[output_format][1], "pipe:1",
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed():
+        try:
+            process.stdin.write(data)
+            await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg gave up early; its exit status says why
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        while True:
+            chunk = await process.stdout.read(READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+        await feeder
+        errors = await process.stderr.read()
+        if await process.wait() != 0:
+            raise TranscodeError(f"ffmpeg exited with {process.returncode}: {errors.decode('utf-8', 'replace')[:200]}")
+    finally:
+        feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def encode(data, output_format):
+    parts = []
+    async for chunk in encode_stream(data, output_format):
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+async def transcode(data, mime_type, output_format, store=False):
+    # Returns (bytes, mime type, blob or None); the source comes back as is when it is
+    # already in the requested format or cannot be transcoded. Only stored results
+    # go to the blob store.
+    if output_format not in FORMATS or FORMATS[output_format][1] is None:
+        return data, mime_type, None
+    target = FORMATS[output_format][0]
+    if mime_type == target or not find_ffmpeg():
+        return data, mime_type, None
+
+    key = make_key(output_format, FORMATS[output_format][1], blobstore.content_hash(data))
+    variants = get_variant_cache()
+    cached = await asyncio.to_thread(variants.get, key, target, store)
+    if cached is not None:
+        return cached[0], target, cached[1]
+
+    try:
+        with stage("transcode"):
+            encoded = await encode(data, output_format)
+    except (OSError, TranscodeError) as e:
+        print(f"Audio transcoding failed, returning {mime_type}: {e}", file=sys.stderr)
+        return data, mime_type, None
+    blob = await asyncio.to_thread(variants.set, key, encoded, target, store)
+    return encoded, target, blob
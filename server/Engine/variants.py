@@ -0,0 +1,36 @@
+from cache import ResponseCache, BytesCache
+import blobstore
+
+# Encoded variants of generated media (resized images, transcoded audio), keyed by the
+# source's hash and the encoding settings so each variant is encoded once. Where a
+# variant lives follows the request: stored results go to the blob store and only a
+# small descriptor is cached; inline results never touch the blob store and are kept
+# as bytes in a size-bounded cache instead.
+
+
+class VariantCache:
+    def __init__(self, name, ttl_seconds, memory_entries, disk_bytes):
+        self.blobs = ResponseCache(name, ttl_seconds=ttl_seconds, memory_entries=1024, disk_bytes=16 * 1024 * 1024)
+        self.inline = BytesCache(
+            f"{name}_inline", ttl_seconds=ttl_seconds, memory_entries=memory_entries, disk_bytes=disk_bytes,
+        )
+
+    def get(self, key, mime_type, store):
+        # Blocking. Returns (bytes, blob or None), or None on a miss
+        if not store:
+            data = self.inline.get(key)
+            return None if data is None else (data, None)
+        blob = self.blobs.get(key)
+        if blob is None:
+            return None
+        data = blobstore.get(blob["hash"], mime_type)
+        return None if data is None else (data, blob)
+
+    def set(self, key, data, mime_type, store):
+        # Blocking. Returns the blob when stored, else None
+        if not store:
+            self.inline.set(key, data)
+            return None
+        blob = blobstore.put(data, mime_type)
+        self.blobs.set(key, blob)
+        return blob
@@ -1,74 +1,449 @@
-import sys
-import json
 import os
-import dotenv
-import base64
-
-# Load environment variables
-dotenv.load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
-
-# Get text from command line argument or stdin
-if len(sys.argv) > 1:
-    user_text = " ".join(sys.argv[1:])
-else:
-    user_text = input("What text would you like to convert to speech? \n")
-
-try:
-    # Try Hugging Face InferenceClient first
-    from huggingface_hub import InferenceClient
-    
-    hf_token = os.getenv('HUGGINGFACE_API_KEY')
-    if hf_token:
-        client = InferenceClient(api_key=hf_token)
-        
-        # Use Hugging Face InferenceClient with Kokoro-82M model
-        audio_bytes = client.text_to_speech(
-            user_text,
-            model="hexgrad/Kokoro-82M",
+import re
+import sys
+import io
+import asyncio
+import contextvars
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from config import INFERENCE_URL, get_api_key
+from http_pool import get_client, close_all
+from breaker import guarded
+from retry import with_retries
+from warmup import ensure_ready, register
+from audio import WAV_MIME_TYPES, concat_wav, sniff_mime_type, wav_format
+from cache import BytesCache, make_key
+import blobstore
+import transcode
+from framing import Media, dumps
+from timings import stage
+
+MODEL = "hexgrad/Kokoro-82M"
+# Override when Kokoro is served somewhere else (a dedicated endpoint, another provider route)
+API_URL = os.environ.get("KOKORO_URL", f"{INFERENCE_URL}/models/{MODEL}")
+register(MODEL, API_URL, {"inputs": "Hi."})
+
+# Sentence-chunked synthesis: chunks of up to CHUNK_CHARS are rendered concurrently
+CHUNK_CHARS = int(os.environ.get("VOICE_CHUNK_CHARS", "200"))
+CHUNK_CONCURRENCY = int(os.environ.get("VOICE_CHUNK_CONCURRENCY", "4"))
+
+# Hedged synthesis: gTTS starts once Kokoro has been silent for HEDGE_AFTER_MS (about
+# Kokoro's p95), and a gTTS win is held for QUALITY_WINDOW_MS in case Kokoro lands too
+HEDGE_AFTER_MS = int(os.environ.get("VOICE_HEDGE_AFTER_MS", "4000"))
+QUALITY_WINDOW_MS = int(os.environ.get("VOICE_QUALITY_WINDOW_MS", "1500"))
+
+# gTTS and huggingface_hub block a thread per call, and a hedge loser can't be
+# interrupted, so they get a pool of their own: however many of them hang, the
+# engine's default executor stays free. Both give up after TIMEOUT_SECONDS.
+BLOCKING_WORKERS = int(os.environ.get("VOICE_BLOCKING_WORKERS", "8"))
+TIMEOUT_SECONDS = float(os.environ.get("VOICE_TIMEOUT_SECONDS", "30"))
+_executor = None
+
+SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+# Per-sentence audio cache: greetings, disclaimers and other boilerplate recur inside
+# otherwise unique texts, so each sentence of a chunked request is synthesized on its
+# own and only sentences not heard before go to Kokoro. Entries live in a size-bounded
+# LRU on disk.
+SEGMENT_CACHE_ENABLED = os.environ.get("VOICE_SEGMENT_CACHE_ENABLED", "true").lower() == "true"
+# The endpoint's default voice; part of the key so voice selection can't serve the wrong speaker
+VOICE = None
+_segment_cache = None
+# Sample format of Kokoro's latest fresh segment; cached segments in any other format
+# (the model or endpoint changed within the TTL) are synthesized again
+_segment_format = None
+
+
+def get_segment_cache():
+    global _segment_cache
+    if _segment_cache is None and SEGMENT_CACHE_ENABLED:
+        _segment_cache = BytesCache(
+            "voice_segments",
+            ttl_seconds=int(os.environ.get("VOICE_SEGMENT_CACHE_TTL_SECONDS", "2592000")),
+            memory_entries=int(os.environ.get("VOICE_SEGMENT_CACHE_MEMORY_ENTRIES", "128")),
+            disk_bytes=int(os.environ.get("VOICE_SEGMENT_CACHE_DISK_MB", "512")) * 1024 * 1024,
         )
-        
-        # Convert audio directly to base64 for web playback
-        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-        
-        result = {
+    return _segment_cache
+
+
+def normalize_sentence(sentence):
+    # Whitespace and Unicode forms don't change the speech; case can ("US" vs "us"), so it is kept
+    return " ".join(unicodedata.normalize("NFKC", sentence).split())
+
+
+def segment_key(sentence):
+    return make_key(normalize_sentence(sentence), MODEL, VOICE)
+
+
+def split_sentences(user_text, max_chars=CHUNK_CHARS):
+    # Group sentences into chunks of at most max_chars, splitting overlong sentences on spaces
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_END.split(user_text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_segments(user_text):
+    # One chunk per sentence (overlong ones still split on spaces) so each can be cached alone
+    return [
+        piece
+        for sentence in SENTENCE_END.split(user_text.strip())
+        for piece in split_sentences(sentence)
+    ]
+
+
+def split_chunks(user_text):
+    if get_segment_cache() is not None:
+        return split_segments(user_text)
+    return split_sentences(user_text)
+
+
+# Set once the direct endpoint answers that it doesn't serve the model; from then on
+# huggingface_hub's InferenceClient resolves the provider and endpoint, as it always used to
+_hub_client = None
+_use_hub = False
+
+
+def hub_available():
+    import importlib.util
+
+    return importlib.util.find_spec("huggingface_hub") is not None
+
+
+def synthesize_hub(user_text, hf_token):
+    global _hub_client
+    if _hub_client is None:
+        from huggingface_hub import InferenceClient
+        _hub_client = InferenceClient(api_key=hf_token, timeout=TIMEOUT_SECONDS)
+    audio_bytes = _hub_client.text_to_speech(user_text, model=MODEL)
+    return audio_bytes, sniff_mime_type(audio_bytes)
+
+
+async def run_blocking(fn, *args):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="voice")
+    # Carry the request's context over so stage timings are still recorded
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, context.run, fn, *args)
+
+
+async def synthesize_kokoro(user_text, hf_token):
+    global _use_hub
+    if _use_hub:
+        # The client is blocking, so run it off the event loop
+        return await run_blocking(synthesize_hub, user_text, hf_token)
+
+    # Call the Kokoro-82M inference endpoint over the shared connection pool
+    headers = {"Authorization": f"Bearer {hf_token}"}
+    # gTTS is always there, so a model that is still loading isn't worth waiting for
+    await ensure_ready(MODEL, max_wait=0)
+    # An open circuit raises straight away, which sends the request to gTTS
+    response = await with_retries(
+        lambda: guarded(MODEL, lambda: get_client(API_URL).post(API_URL, headers=headers, json={"inputs": user_text}))
+    )
+    if response.status_code in (404, 410) and hub_available():
+        # Not served at API_URL (any more); don't let every request quietly end up on gTTS
+        print(f"{API_URL} answered {response.status_code}; using huggingface_hub for {MODEL}", file=sys.stderr)
+        _use_hub = True
+        return await run_blocking(synthesize_hub, user_text, hf_token)
+    if response.status_code != 200:
+        raise Exception(f"API Error {response.status_code}: {response.text[:200]}")
+    mime_type = response.headers.get("content-type", "audio/wav").split(";")[0]
+    if not mime_type.startswith("audio/"):
+        mime_type = "audio/wav"
+    return response.content, mime_type
+
+
+async def synthesize_segment(chunk, hf_token):
+    # One chunk of speech, from the segment cache when the same sentence was synthesized before
+    cache = get_segment_cache()
+    if cache is None:
+        return await synthesize_kokoro(chunk, hf_token)
+
+    global _segment_format
+    key = segment_key(chunk)
+    with stage("segment_cache"):
+        cached = cache.get(key)
+    if cached is not None and (_segment_format is None or wav_format(cached) == _segment_format):
+        return cached, "audio/wav"
+
+    audio_bytes, mime_type = await synthesize_kokoro(chunk, hf_token)
+    # Only WAV segments can be stitched back together later
+    if mime_type in WAV_MIME_TYPES:
+        _segment_format = wav_format(audio_bytes)
+        with stage("segment_cache"):
+            cache.set(key, audio_bytes)
+    return audio_bytes, mime_type
+
+
+def start_chunks(chunks, hf_token):
+    # Start every chunk now; the semaphore bounds how many hit Kokoro at once
+    slots = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+    async def render(chunk):
+        async with slots:
+            return await synthesize_segment(chunk, hf_token)
+
+    return [asyncio.ensure_future(render(chunk)) for chunk in chunks]
+
+
+class StitchError(Exception):
+    pass
+
+
+@stage("stitch")
+def stitch(rendered):
+    mime_types = {mime_type for _, mime_type in rendered}
+    if not mime_types <= set(WAV_MIME_TYPES):
+        raise StitchError(f"Cannot stitch {', '.join(sorted(mime_types))} audio chunks")
+    try:
+        return concat_wav([audio_bytes for audio_bytes, _ in rendered]), "audio/wav"
+    except ValueError as e:
+        # Segments in different sample formats, or a file that isn't really WAV
+        raise StitchError(f"Cannot stitch audio chunks: {e}") from e
+
+
+async def synthesize_chunked(user_text, hf_token):
+    chunks = split_chunks(user_text)
+    if len(chunks) <= 1:
+        return await synthesize_segment(user_text, hf_token)
+
+    tasks = start_chunks(chunks, hf_token)
+    try:
+        rendered = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    try:
+        return stitch(rendered)
+    except StitchError as e:
+        # Kokoro answered in a format that can't be concatenated: ask for the whole text at once
+        print(f"{e}; synthesizing unchunked", file=sys.stderr)
+        return await synthesize_kokoro(user_text, hf_token)
+
+
+@stage("gtts")
+def synthesize_gtts(user_text):
+    from gtts import gTTS
+
+    # Use Google Text-to-Speech as fallback
+    tts = gTTS(text=user_text, lang='en', slow=False, timeout=TIMEOUT_SECONDS)
+
+    # Save audio to a BytesIO buffer instead of a file
+    audio_buffer = io.BytesIO()
+    tts.write_to_fp(audio_buffer)
+    return audio_buffer.getvalue()
+
+
+def audio_result(audio_bytes, mime_type, blob):
+    if blob is not None:
+        return {"audio_url": blob["url"], "audio": blob}
+    # Hand back the raw bytes; they are only base64-encoded if they end up in JSON
+    return {"audio_data": Media(audio_bytes, mime_type)}
+
+
+async def finish_audio(audio_bytes, mime_type, store, output_format):
+    # Transcode to the requested format (see transcode.py), store if asked, and
+    # return the audio fields of the result
+    audio_bytes, mime_type, blob = await transcode.transcode(audio_bytes, mime_type, output_format, store)
+    if not store:
+        return audio_result(audio_bytes, mime_type, None)
+    if blob is None:
+        blob = await asyncio.to_thread(blobstore.put, audio_bytes, mime_type)
+    return audio_result(audio_bytes, mime_type, blob)
+
+
+def gtts_result(user_text, audio, hf_error):
+    return {
+        "success": True,
+        **audio,
+        "text": user_text,
+        "note": f"Audio generated using Google TTS (HF fallback: {str(hf_error)[:100]})"
+    }
+
+
+async def fallback_gtts(user_text, store, hf_error, output_format=None):
+    # Fallback to gTTS if Hugging Face fails
+    try:
+        # gTTS is blocking, so run it off the event loop
+        audio_bytes = await run_blocking(synthesize_gtts, user_text)
+        audio = await finish_audio(audio_bytes, "audio/mpeg", store, output_format)
+        return gtts_result(user_text, audio, hf_error)
+
+    except Exception as gtts_error:
+        # If both fail, return error
+        return {
+            "success": False,
+            "error": f"Both HF and gTTS failed. HF: {str(hf_error)[:50]}, gTTS: {str(gtts_error)[:50]}"
+        }
+
+
+class HedgeFailed(Exception):
+    def __init__(self, hf_error, gtts_error):
+        super().__init__(f"Both HF and gTTS failed. HF: {str(hf_error)[:50]}, gTTS: {str(gtts_error)[:50]}")
+
+
+def succeeded(task):
+    return task is not None and task.done() and not task.cancelled() and task.exception() is None
+
+
+async def synthesize_hedged(user_text, kokoro_call):
+    # Start Kokoro, start gTTS as well if Kokoro hasn't answered within HEDGE_AFTER_MS,
+    # and return whichever succeeds first as (audio_bytes, mime_type, hf_error).
+    # hf_error is None when Kokoro won.
+    kokoro = asyncio.ensure_future(kokoro_call)
+    gtts = None
+    try:
+        await asyncio.wait({kokoro}, timeout=HEDGE_AFTER_MS / 1000)
+        if not succeeded(kokoro):
+            gtts = asyncio.ensure_future(run_blocking(synthesize_gtts, user_text))
+            await asyncio.wait({kokoro, gtts}, return_when=asyncio.FIRST_COMPLETED)
+            if succeeded(gtts) and not kokoro.done():
+                # Prefer Kokoro's quality if it lands shortly after gTTS
+                await asyncio.wait({kokoro}, timeout=QUALITY_WINDOW_MS / 1000)
+            elif not gtts.done():
+                await asyncio.wait({gtts})
+            elif not kokoro.done():
+                await asyncio.wait({kokoro})
+
+        if succeeded(kokoro):
+            audio_bytes, mime_type = kokoro.result()
+            return audio_bytes, mime_type, None
+        if succeeded(gtts):
+            hf_error = kokoro.exception() if kokoro.done() else Exception(
+                f"Kokoro-82M did not answer within {HEDGE_AFTER_MS + QUALITY_WINDOW_MS} ms"
+            )
+            return gtts.result(), "audio/mpeg", hf_error
+        raise HedgeFailed(kokoro.exception(), gtts.exception())
+    finally:
+        # The loser is cancelled; a gTTS thread can't be interrupted, but its result is dropped
+        for task in (kokoro, gtts):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def generate_voice(user_text, store=False, chunked=False, hedged=False, output_format=None):
+    try:
+        # Try Hugging Face Kokoro-82M first
+        hf_token = get_api_key()
+        if not hf_token:
+            raise Exception("HUGGINGFACE_API_KEY not found")
+
+        # Cached sentences are only looked up on the chunked path
+        if chunked:
+            kokoro_call = synthesize_chunked(user_text, hf_token)
+        else:
+            kokoro_call = synthesize_kokoro(user_text, hf_token)
+
+        if hedged:
+            audio_bytes, mime_type, hf_error = await synthesize_hedged(user_text, kokoro_call)
+            if hf_error is not None:
+                audio = await finish_audio(audio_bytes, mime_type, store, output_format)
+                return gtts_result(user_text, audio, hf_error)
+        else:
+            audio_bytes, mime_type = await kokoro_call
+        audio = await finish_audio(audio_bytes, mime_type, store, output_format)
+
+        return {
             "success": True,
-            "audio_data": f"data:audio/wav;base64,{audio_base64}",
+            **audio,
             "text": user_text,
             "note": "Audio generated using Kokoro-82M TTS model"
         }
-        print(json.dumps(result))
-    else:
-        raise Exception("HUGGINGFACE_API_KEY not found")
-        
-except Exception as hf_error:
-    # Fallback to gTTS if Hugging Face fails
+
+    except HedgeFailed as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    except Exception as hf_error:
+        return await fallback_gtts(user_text, store, hf_error, output_format)
+
+
+async def stream_voice(user_text, store=False, output_format=None):
+    # Yields {"event": "chunk", ...} per sentence chunk in order as soon as it and
+    # every chunk before it are ready, then the stitched result
+    tasks = []
     try:
-        from gtts import gTTS
-        import io
-        
-        # Use Google Text-to-Speech as fallback
-        tts = gTTS(text=user_text, lang='en', slow=False)
-        
-        # Save audio to a BytesIO buffer instead of a file
-        audio_buffer = io.BytesIO()
-        tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)
-        
-        # Convert audio to base64 for web playback
-        audio_base64 = base64.b64encode(audio_buffer.getvalue()).decode('utf-8')
-        
+        hf_token = get_api_key()
+        if not hf_token:
+            raise Exception("HUGGINGFACE_API_KEY not found")
+
+        chunks = split_chunks(user_text)
+        tasks = start_chunks(chunks, hf_token)
+        rendered = []
+        for index, task in enumerate(tasks):
+            audio_bytes, mime_type = await task
+            rendered.append((audio_bytes, mime_type))
+            # Later chunks keep synthesizing while this one is encoded
+            yield {
+                "event": "chunk",
+                "index": index,
+                "count": len(chunks),
+                "text": chunks[index],
+                **await finish_audio(audio_bytes, mime_type, store, output_format),
+            }
+
+        # The full file is encoded from the stitched WAV rather than by joining encoded chunks
+        try:
+            audio_bytes, mime_type = stitch(rendered) if len(rendered) > 1 else rendered[0]
+        except StitchError as e:
+            print(f"{e}; synthesizing unchunked", file=sys.stderr)
+            audio_bytes, mime_type = await synthesize_kokoro(user_text, hf_token)
         result = {
             "success": True,
-            "audio_data": f"data:audio/mpeg;base64,{audio_base64}",
+            **await finish_audio(audio_bytes, mime_type, store, output_format),
             "text": user_text,
-            "note": f"Audio generated using Google TTS (HF fallback: {str(hf_error)[:100]})"
-        }
-        print(json.dumps(result))
-        
-    except Exception as gtts_error:
-        # If both fail, return error
-        error_result = {
-            "success": False,
-            "error": f"Both HF and gTTS failed. HF: {str(hf_error)[:50]}, gTTS: {str(gtts_error)[:50]}"
+            "note": "Audio generated using Kokoro-82M TTS model"
         }
-        print(json.dumps(error_result))
+    except Exception as hf_error:
+        result = await fallback_gtts(user_text, store, hf_error, output_format)
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield result
+
+
+async def main(user_text):
+    try:
+        return await generate_voice(user_text)
+    finally:
+        await close_all()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--batch"]:
+        import batch
+        sys.exit(batch.main(
+            sys.argv[1:], "Synthesize speech for every text in a JSONL file",
+            lambda record, options: generate_voice(record["text"], store=not options.inline, chunked=True),
+            "text",
+        ))
+
+    # Get text from command line argument or stdin
+    if len(sys.argv) > 1:
+        user_text = " ".join(sys.argv[1:])
+    else:
+        user_text = input("What text would you like to convert to speech? \n")
+
+    print(dumps(asyncio.run(main(user_text))))
@@ -0,0 +1,254 @@
+import os
+import time
+import asyncio
+import threading
+
+from cache import CACHE_DIR
+from breaker import CircuitOpen
+from timings import stage
+
+# Keep-warm pinger for the inference API models, which unload after a quiet spell
+# and then answer 503 while they load again. Each registered model gets a cheap
+# request on a schedule that adapts to what the engines see:
+#   - real traffic already keeps a model warm, so pings only fill the gaps between calls
+#   - every 503 raises the model's cold score, which shortens the interval
+#   - a model nobody has used for IDLE_SECONDS is left alone
+# State lives in a SQLite file next to the breaker's, so one worker pings on behalf
+# of all of them and every worker sees the same readiness.
+ENABLED = os.environ.get("WARMUP_ENABLED", "true").lower() == "true"
+INTERVAL_SECONDS = float(os.environ.get("WARMUP_INTERVAL_SECONDS", "300"))
+MIN_INTERVAL_SECONDS = float(os.environ.get("WARMUP_MIN_INTERVAL_SECONDS", "60"))
+IDLE_SECONDS = float(os.environ.get("WARMUP_IDLE_SECONDS", "3600"))
+TIMEOUT_SECONDS = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", "60"))
+# Requests wait for a loading model at most this long before failing fast
+MAX_WAIT_SECONDS = float(os.environ.get("WARMUP_MAX_WAIT_SECONDS", "30"))
+# 503s count for less as they age (half-life in seconds)
+COLD_HALF_LIFE_SECONDS = 3600
+TICK_SECONDS = 5
+
+# name -> (url, payload) for every model worth keeping warm
+MODELS = {}
+
+
+class ModelLoading(CircuitOpen):
+    def __init__(self, name, retry_in):
+        super().__init__(name, retry_in)
+        self.args = (f"{name} is loading, please try again in {max(1, round(retry_in))} seconds",)
+
+
+def register(name, url, payload):
+    MODELS[name] = (url, payload)
+
+
+class Warmup:
+    def __init__(self, path):
+        import sqlite3
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS models ("
+            "name TEXT PRIMARY KEY, state TEXT NOT NULL DEFAULT 'unknown', "
+            "ready_at REAL NOT NULL DEFAULT 0, next_ping_at REAL NOT NULL DEFAULT 0, "
+            "last_request_at REAL NOT NULL DEFAULT 0, last_ping_at REAL NOT NULL DEFAULT 0, "
+            "cold_score REAL NOT NULL DEFAULT 0, cold_at REAL NOT NULL DEFAULT 0, "
+            "pings INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def readiness(self, name):
+        # Returns (state, seconds until ready); a load whose estimate has passed is worth trying again
+        with self.lock:
+            row = self.db.execute("SELECT state, ready_at FROM models WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return "unknown", 0.0
+        state, ready_at = row
+        retry_in = ready_at - time.time()
+        if state == "loading" and retry_in <= 0:
+            return "unknown", 0.0
+        return state, max(0.0, retry_in)
+
+    def observe(self, name, status_code, retry_in=None, ping=False):
+        # Records how a call (real or keep-warm) to the model went
+        now = time.time()
+        if status_code == 200:
+            state, ready_at = "ready", now
+        elif status_code == 503:
+            state, ready_at = "loading", now + (retry_in or MIN_INTERVAL_SECONDS)
+        else:
+            state, ready_at = "unknown", 0
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("INSERT OR IGNORE INTO models (name) VALUES (?)", (name,))
+                cold_score, cold_at = self.db.execute(
+                    "SELECT cold_score, cold_at FROM models WHERE name = ?", (name,)
+                ).fetchone()
+                cold_score = self.decayed(cold_score, cold_at, now) + (1 if status_code == 503 else 0)
+                self.db.execute(
+                    "UPDATE models SET state = ?, ready_at = ?, cold_score = ?, cold_at = ?, "
+                    "last_request_at = MAX(last_request_at, ?), last_ping_at = MAX(last_ping_at, ?), "
+                    "pings = pings + ? WHERE name = ?",
+                    (state, ready_at, cold_score, now, 0 if ping else now, now if ping else 0, int(ping), name),
+                )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def decayed(self, cold_score, cold_at, now):
+        return cold_score * 0.5 ** (max(0.0, now - cold_at) / COLD_HALF_LIFE_SECONDS)
+
+    def interval(self, cold_score):
+        # Models that keep going cold get pinged more often
+        return max(MIN_INTERVAL_SECONDS, INTERVAL_SECONDS / (1 + cold_score))
+
+    def claim(self, name):
+        # True when this worker should ping the model now; the claim keeps other workers off it
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO models (name) VALUES (?)", (name,))
+            state, ready_at, next_ping_at, last_request_at, last_ping_at, cold_score, cold_at = self.db.execute(
+                "SELECT state, ready_at, next_ping_at, last_request_at, last_ping_at, cold_score, cold_at "
+                "FROM models WHERE name = ?",
+                (name,),
+            ).fetchone()
+            if now < next_ping_at or now - last_request_at > IDLE_SECONDS:
+                return False
+            if state == "loading":
+                # Check back once the model says it should be up
+                due = ready_at
+            else:
+                due = max(last_request_at, last_ping_at) + self.interval(self.decayed(cold_score, cold_at, now))
+            if now < due:
+                self.db.execute(
+                    "UPDATE models SET next_ping_at = ? WHERE name = ? AND next_ping_at = ?",
+                    (due, name, next_ping_at),
+                )
+                return False
+            return bool(self.db.execute(
+                "UPDATE models SET next_ping_at = ? WHERE name = ? AND next_ping_at = ?",
+                (now + TIMEOUT_SECONDS, name, next_ping_at),
+            ).rowcount)
+
+    def release(self, name):
+        # Lets the schedule decide the next ping once this one has reported back
+        with self.lock:
+            self.db.execute("UPDATE models SET next_ping_at = 0 WHERE name = ?", (name,))
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT name, state, ready_at, last_request_at, last_ping_at, cold_score, cold_at, pings FROM models"
+            ).fetchall()
+        models = {}
+        for name, state, ready_at, last_request_at, last_ping_at, cold_score, cold_at, pings in rows:
+            if name not in MODELS:
+                continue
+            cold_score = self.decayed(cold_score, cold_at, now)
+            models[name] = {
+                "state": "unknown" if state == "loading" and ready_at <= now else state,
+                "ready_in": round(max(0.0, ready_at - now), 1) if state == "loading" else 0.0,
+                "idle": now - last_request_at > IDLE_SECONDS,
+                "interval_seconds": round(self.interval(cold_score), 1),
+                "cold_score": round(cold_score, 3),
+                "last_ping_age": round(now - last_ping_at, 1) if last_ping_at else None,
+                "pings": pings,
+            }
+        return models
+
+
+class DisabledWarmup:
+    def readiness(self, name):
+        return "unknown", 0.0
+
+    def observe(self, name, status_code, retry_in=None, ping=False):
+        pass
+
+    def claim(self, name):
+        return False
+
+    def release(self, name):
+        pass
+
+    def stats(self):
+        return {}
+
+
+_warmup = None
+
+
+def get_warmup():
+    global _warmup
+    if _warmup is None:
+        if ENABLED:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _warmup = Warmup(os.path.join(CACHE_DIR, "warmup.sqlite3"))
+        else:
+            _warmup = DisabledWarmup()
+    return _warmup
+
+
+def observe(name, response):
+    # Called for every upstream response so readiness follows real traffic too
+    if name not in MODELS:
+        return
+    from http_pool import retry_after_seconds
+
+    retry_in = retry_after_seconds(response) if response.status_code == 503 else None
+    get_warmup().observe(name, response.status_code, retry_in)
+
+
+async def ensure_ready(name, max_wait=MAX_WAIT_SECONDS):
+    # Waits out a load that is nearly done; raises ModelLoading when it would take
+    # longer than max_wait or the request's deadline allows
+    from retry import time_left
+
+    state, retry_in = get_warmup().readiness(name)
+    if state != "loading":
+        return
+    if retry_in > min(max_wait, time_left(time.monotonic())):
+        raise ModelLoading(name, retry_in)
+    with stage("model_loading"):
+        await asyncio.sleep(retry_in)
+
+
+async def ping(name, api_key):
+    from http_pool import get_client, retry_after_seconds
+
+    url, payload = MODELS[name]
+    warmup = get_warmup()
+    try:
+        response = await asyncio.wait_for(
+            get_client(url).post(url, headers={"Authorization": f"Bearer {api_key}"}, json=payload),
+            TIMEOUT_SECONDS,
+        )
+    except Exception:
+        # Network trouble says nothing about whether the model is loaded
+        warmup.observe(name, 0, ping=True)
+    else:
+        retry_in = retry_after_seconds(response) if response.status_code == 503 else None
+        warmup.observe(name, response.status_code, retry_in, ping=True)
+    finally:
+        warmup.release(name)
+
+
+async def run(api_key):
+    # Background loop started by the engine; pings whichever models are due
+    warmup = get_warmup()
+    if not ENABLED or not api_key:
+        return
+    pending = set()
+    try:
+        while True:
+            for name in MODELS:
+                if warmup.claim(name):
+                    task = asyncio.create_task(ping(name, api_key))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            await asyncio.sleep(TICK_SECONDS)
+    finally:
+        for task in pending:
+            task.cancel()
@@ -8,6 +8,7 @@ require('dotenv').config();
 const authRoutes = require('./routes/auth');
 const aiRoutes = require('./routes/ai');
 const { connectDB } = require('./config/database');
+const { engine, mediaDir } = require('./services/engine');
 
 const app = express();
 const PORT = process.env.PORT || 5000;
@@ -42,6 +43,9 @@ app.use(express.urlencoded({ extended: true, limit: '10mb' }));
 // Serve static files from React app
 app.use(express.static(path.join(__dirname, "../client/build")));
 
+// Serve generated media; files are content-addressed so they never change
+app.use('/media', express.static(mediaDir, { immutable: true, maxAge: '1y', fallthrough: false }));
+
 // Routes
 app.use('/api/auth', authRoutes);
 app.use('/api/ai', aiRoutes);
@@ -51,6 +55,17 @@ app.get('/api/health', (req, res) => {
   res.json({ status: 'OK', message: 'Server is running' });
 });
 
+// Prometheus metrics from the engine workers; off by default since the endpoint is unauthenticated
+if (process.env.METRICS_ENABLED === 'true') {
+  app.get('/metrics', async (req, res) => {
+    try {
+      res.type('text/plain; version=0.0.4').send(await engine.metrics());
+    } catch (error) {
+      res.status(500).send(`# ${error.message}\n`);
+    }
+  });
+}
+
 // Error handling middleware
 app.use((err, req, res, next) => {
   console.error(err.stack);
@@ -69,6 +84,8 @@ app.get('*', (req, res) => {
 const startServer = async () => {
   try {
     await connectDB();
+    // Pre-fork the Python engine workers before accepting traffic
+    engine.start();
     app.listen(PORT, () => {
       console.log(`Server running on port ${PORT}`);
       console.log(`Environment: ${process.env.NODE_ENV}`);
@@ -2,7 +2,14 @@ const express = require('express');
 const Joi = require('joi');
 const { authenticateToken } = require('../middleware/auth');
 const { pool } = require('../config/database');
-const { generateText, generateImage, generateVoice } = require('../services/ai');
+const {
+  generateText,
+  streamText,
+  generateImage,
+  generateVoice,
+  streamVoice,
+  formatServerTiming
+} = require('../services/ai');
 
 const router = express.Router();
 
@@ -16,15 +23,37 @@ const textGenerationSchema = Joi.object({
 const imageGenerationSchema = Joi.object({
   prompt: Joi.string().min(1).max(1000).required(),
   size: Joi.string().valid('256x256', '512x512', '1024x1024').default('512x512'),
-  style: Joi.string().valid('realistic', 'artistic', 'cartoon').default('realistic')
+  style: Joi.string().valid('realistic', 'artistic', 'cartoon').default('realistic'),
+  format: Joi.string().valid('auto', 'avif', 'webp', 'jpeg', 'png').default('auto')
 });
 
 const voiceGenerationSchema = Joi.object({
   text: Joi.string().min(1).max(1000).required(),
   voice: Joi.string().valid('alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer').default('alloy'),
-  model: Joi.string().valid('eleven_monolingual_v1', 'eleven_multilingual_v1').default('eleven_monolingual_v1')
+  model: Joi.string().valid('eleven_monolingual_v1', 'eleven_multilingual_v1').default('eleven_monolingual_v1'),
+  format: Joi.string().valid('auto', 'webm', 'opus', 'mp3', 'wav').default('auto')
 });
 
+// Most compact first; the engine falls back further if it cannot encode one
+const imageFormats = [['image/avif', 'avif'], ['image/webp', 'webp'], ['image/jpeg', 'jpeg'], ['image/png', 'png']];
+const defaultImageFormat = process.env.IMAGE_FORMAT || 'jpeg';
+const audioFormats = [['audio/webm', 'webm'], ['audio/ogg', 'opus'], ['audio/mpeg', 'mp3'], ['audio/wav', 'wav']];
+const defaultAudioFormat = process.env.VOICE_FORMAT || 'mp3';
+
+// Picks the format from explicit media types in the Accept header; a bare */* says nothing about decoder support
+const negotiateFormat = (req, requested, formats, fallback) => {
+  if (requested !== 'auto') {
+    return requested;
+  }
+  const accepted = new Set((req.get('Accept') || '')
+    .split(',')
+    .map((part) => part.trim().split(';'))
+    .filter(([, ...params]) => !params.some((param) => /^\s*q=0(\.0*)?\s*$/.test(param)))
+    .map(([type]) => type.trim().toLowerCase()));
+  const match = formats.find(([type]) => accepted.has(type));
+  return match ? match[1] : fallback;
+};
+
 // Helper function to log activity (optional user)
 const logActivity = async (userId, toolType, inputData, outputData) => {
   try {
@@ -39,6 +68,11 @@ const logActivity = async (userId, toolType, inputData, outputData) => {
   }
 };
 
+// Sets the engine's per-stage timings as a Server-Timing header (when SERVER_TIMING=true)
+const setServerTiming = (res) => (timings) => {
+  res.set('Server-Timing', formatServerTiming(timings));
+};
+
 // Optional authentication middleware
 const optionalAuth = (req, res, next) => {
   const authHeader = req.headers['authorization'];
@@ -71,7 +105,7 @@ router.post('/text', optionalAuth, async (req, res) => {
     const { prompt, model, maxTokens } = value;
 
     // Generate text using AI service
-    const result = await generateText(prompt, model, maxTokens);
+    const result = await generateText(prompt, model, maxTokens, setServerTiming(res));
 
     // Log activity (only if user is authenticated)
     if (req.user) {
@@ -96,6 +130,67 @@ router.post('/text', optionalAuth, async (req, res) => {
   }
 });
 
+// Switch the response to Server-Sent Events; the signal aborts when the client disconnects
+const openEventStream = (res) => {
+  res.set({
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache, no-transform',
+    Connection: 'keep-alive',
+    'X-Accel-Buffering': 'no'
+  });
+  res.flushHeaders();
+
+  const abortController = new AbortController();
+  res.on('close', () => {
+    if (!res.writableFinished) {
+      abortController.abort();
+    }
+  });
+
+  return {
+    sendEvent: (event, data) => {
+      res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+    },
+    signal: abortController.signal
+  };
+};
+
+// Text-to-Text Generation streamed as Server-Sent Events
+router.post('/text/stream', optionalAuth, async (req, res) => {
+  const { error, value } = textGenerationSchema.validate(req.body);
+  if (error) {
+    return res.status(400).json({ error: error.details[0].message });
+  }
+
+  const { prompt, model, maxTokens } = value;
+  const { sendEvent, signal } = openEventStream(res);
+
+  try {
+    const result = await streamText(prompt, model, maxTokens, (content) => {
+      sendEvent('delta', { content });
+    }, signal);
+
+    // Log activity (only if user is authenticated)
+    if (req.user) {
+      await logActivity(req.user.id, 'text_generation', { prompt, model, maxTokens }, { result });
+    }
+
+    sendEvent('done', {
+      prompt,
+      generatedText: result,
+      model,
+      maxTokens
+    });
+  } catch (error) {
+    console.error('Text generation error:', error);
+    sendEvent('error', {
+      error: 'Text generation failed',
+      message: error.message
+    });
+  }
+  res.end();
+});
+
 // Text-to-Image Generation
 router.post('/image', optionalAuth, async (req, res) => {
   try {
@@ -105,20 +200,24 @@ router.post('/image', optionalAuth, async (req, res) => {
     }
 
     const { prompt, size, style } = value;
+    const format = negotiateFormat(req, value.format, imageFormats, defaultImageFormat);
 
     // Generate image using AI service
-    const result = await generateImage(prompt, size, style);
+    const { imageUrl, thumbnailUrl } = await generateImage(prompt, size, style, format, setServerTiming(res));
 
     // Log activity (only if user is authenticated)
     if (req.user) {
-      await logActivity(req.user.id, 'image_generation', { prompt, size, style }, { imageUrl: result });
+      await logActivity(req.user.id, 'image_generation', { prompt, size, style }, { imageUrl });
     }
 
+    // The response body is JSON either way, but caches must key it on the negotiated format
+    res.vary('Accept');
     res.json({
       success: true,
       data: {
         prompt,
-        imageUrl: result,
+        imageUrl,
+        thumbnailUrl,
         size,
         style
       }
@@ -141,15 +240,17 @@ router.post('/voice', optionalAuth, async (req, res) => {
     }
 
     const { text, voice, model } = value;
+    const format = negotiateFormat(req, value.format, audioFormats, defaultAudioFormat);
 
     // Generate voice using AI service
-    const result = await generateVoice(text, voice, model);
+    const result = await generateVoice(text, voice, model, format, setServerTiming(res));
 
     // Log activity (only if user is authenticated)
     if (req.user) {
       await logActivity(req.user.id, 'voice_generation', { text, voice, model }, { audioUrl: result });
     }
 
+    res.vary('Accept');
     res.json({
       success: true,
       data: {
@@ -168,6 +269,43 @@ router.post('/voice', optionalAuth, async (req, res) => {
   }
 });
 
+// Text-to-Voice Generation streamed as Server-Sent Events, one playable chunk per sentence group
+router.post('/voice/stream', optionalAuth, async (req, res) => {
+  const { error, value } = voiceGenerationSchema.validate(req.body);
+  if (error) {
+    return res.status(400).json({ error: error.details[0].message });
+  }
+
+  const { text, voice, model } = value;
+  const format = negotiateFormat(req, value.format, audioFormats, defaultAudioFormat);
+  const { sendEvent, signal } = openEventStream(res);
+
+  try {
+    const result = await streamVoice(text, voice, model, format, (chunk) => {
+      sendEvent('chunk', chunk);
+    }, signal);
+
+    // Log activity (only if user is authenticated)
+    if (req.user) {
+      await logActivity(req.user.id, 'voice_generation', { text, voice, model }, { audioUrl: result });
+    }
+
+    sendEvent('done', {
+      text,
+      audioUrl: result,
+      voice,
+      model
+    });
+  } catch (error) {
+    console.error('Voice generation error:', error);
+    sendEvent('error', {
+      error: 'Voice generation failed',
+      message: error.message
+    });
+  }
+  res.end();
+});
+
 // Get available models
 router.get('/models', (req, res) => {
   res.json({
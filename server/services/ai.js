@@ -1,185 +1,153 @@
 // AI Service functions for integrating with external APIs
-const { spawn } = require('child_process');
-const path = require('path');
+const { performance } = require('perf_hooks');
+const { engine, storeMedia } = require('./engine');
+
+// Media crosses the engine pipe as raw bytes; encode it only when the client needs a data URI
+const toDataUri = (media) => `data:${media.mimeType};base64,${media.data.toString('base64')}`;
+
+// Render long voice inputs sentence by sentence in parallel
+const chunkVoice = process.env.VOICE_CHUNKED !== 'false';
+// Race gTTS against a slow Kokoro instead of waiting for Kokoro to fail
+const hedgeVoice = process.env.VOICE_HEDGED !== 'false';
+// Ask the engines for per-stage timings and expose them as Server-Timing headers
+const collectTimings = process.env.SERVER_TIMING === 'true';
+
+// {"upstream": 812.4, "total": 830.1} -> "upstream;dur=812.4, total;dur=830.1"
+const formatServerTiming = (timings) => Object.entries(timings)
+  .map(([stage, ms]) => `${stage};dur=${ms}`)
+  .join(', ');
+
+// Returns the media URL, encoding inline media as a data URI (timed as the "encode" stage)
+const mediaUrl = (url, media, timings) => {
+  if (url) {
+    return url;
+  }
+  const started = performance.now();
+  const dataUri = toDataUri(media);
+  if (timings) {
+    timings.encode = Math.round((performance.now() - started) * 100) / 100;
+  }
+  return dataUri;
+};
 
-const generateText = async (prompt, model = 'gpt-3.5-turbo', maxTokens = 500) => {
+const generateText = async (prompt, model = 'gpt-3.5-turbo', maxTokens = 500, onTimings = () => {}) => {
   try {
-    return new Promise((resolve, reject) => {
-      // Path to the Python script
-      const pythonScript = path.join(__dirname, '../Engine/text.py');
-      const engineDir = path.join(__dirname, '../Engine');
-      
-      // Check if we're on Windows and use the virtual environment
-      const pythonCommand = process.platform === 'win32' 
-        ? path.join(engineDir, 'venv', 'Scripts', 'python.exe')
-        : 'python3';
-
-      // Spawn Python process with the prompt as argument
-      const pythonProcess = spawn(pythonCommand, [pythonScript, prompt], {
-        cwd: engineDir,
-        stdio: ['pipe', 'pipe', 'pipe']
-      });
-
-      let output = '';
-      let error = '';
-
-      pythonProcess.stdout.on('data', (data) => {
-        output += data.toString();
-      });
-
-      pythonProcess.stderr.on('data', (data) => {
-        error += data.toString();
-      });
-
-      pythonProcess.on('close', (code) => {
-        if (code === 0) {
-          try {
-            // Parse the JSON response from Python
-            const result = JSON.parse(output.trim());
-            if (result.success) {
-              resolve(result.content);
-            } else {
-              reject(new Error(result.error || 'Python script failed'));
-            }
-          } catch (parseError) {
-            // If JSON parsing fails, return the raw output
-            resolve(output.trim());
-          }
-        } else {
-          reject(new Error(`Python script failed with code ${code}: ${error}`));
-        }
-      });
-
-      pythonProcess.on('error', (err) => {
-        reject(new Error(`Failed to start Python process: ${err.message}`));
-      });
-    });
+    // Send the prompt to the persistent Python engine
+    const result = await engine.request('text', { prompt, max_tokens: maxTokens }, { timings: collectTimings });
+    if (result.timings) {
+      onTimings(result.timings);
+    }
+    if (!result.success) {
+      throw new Error(result.error || 'Python script failed');
+    }
+    return result.content;
   } catch (error) {
     console.error('Text generation error:', error);
     throw new Error(`Text generation failed: ${error.message}`);
   }
 };
 
-const generateImage = async (prompt, size = '512x512', style = 'realistic') => {
+// Streams text deltas to onDelta as they arrive and resolves with the full text
+const streamText = async (prompt, model = 'gpt-3.5-turbo', maxTokens = 500, onDelta = () => {}, signal) => {
   try {
-    return new Promise((resolve, reject) => {
-      // Path to the Python script
-      const pythonScript = path.join(__dirname, '../Engine/image.py');
-      const engineDir = path.join(__dirname, '../Engine');
-      
-      // Check if we're on Windows and use the virtual environment
-      const pythonCommand = process.platform === 'win32' 
-        ? path.join(engineDir, 'venv', 'Scripts', 'python.exe')
-        : 'python3';
-
-      // Spawn Python process with the prompt as argument
-      const pythonProcess = spawn(pythonCommand, [pythonScript, prompt], {
-        cwd: engineDir,
-        stdio: ['pipe', 'pipe', 'pipe']
-      });
-
-      let output = '';
-      let error = '';
-
-      pythonProcess.stdout.on('data', (data) => {
-        output += data.toString();
-      });
-
-      pythonProcess.stderr.on('data', (data) => {
-        error += data.toString();
-      });
-
-      pythonProcess.on('close', (code) => {
-        if (code === 0) {
-          try {
-            // Parse the JSON response from Python
-            const result = JSON.parse(output.trim());
-            if (result.success) {
-              // Return the base64 image data URL for frontend
-              resolve(result.image_data);
-            } else {
-              reject(new Error(result.error || 'Python script failed'));
-            }
-          } catch (parseError) {
-            // If JSON parsing fails, assume it's an error message
-            reject(new Error(`Failed to parse response: ${output.trim()}`));
-          }
-        } else {
-          reject(new Error(`Python script failed with code ${code}: ${error}`));
+    const result = await engine.request('text', { prompt, max_tokens: maxTokens }, {
+      onEvent: (event) => {
+        if (event.event === 'delta') {
+          onDelta(event.content);
         }
-      });
-
-      pythonProcess.on('error', (err) => {
-        reject(new Error(`Failed to start Python process: ${err.message}`));
-      });
+      },
+      signal
     });
+    if (!result.success) {
+      throw new Error(result.error || 'Python script failed');
+    }
+    return result.content;
+  } catch (error) {
+    console.error('Text streaming error:', error);
+    throw new Error(`Text generation failed: ${error.message}`);
+  }
+};
+
+const generateImage = async (prompt, size = '512x512', style = 'realistic', format = 'jpeg', onTimings = () => {}) => {
+  try {
+    // Thumbnails are only worth it as stored URLs, not as extra base64 payload
+    const result = await engine.request('image', {
+      prompt,
+      size,
+      format,
+      store: storeMedia,
+      thumbnail: storeMedia
+    }, { timings: collectTimings });
+    // The stored media URL, or the base64 data URL when the store is disabled
+    const imageUrl = result.success ? mediaUrl(result.image_url, result.image_data, result.timings) : null;
+    if (result.timings) {
+      onTimings(result.timings);
+    }
+    if (!result.success) {
+      throw new Error(result.error || 'Python script failed');
+    }
+    return { imageUrl, thumbnailUrl: result.thumbnail_url || null };
   } catch (error) {
     console.error('Image generation error:', error);
     throw new Error(`Image generation failed: ${error.message}`);
   }
 };
 
-const generateVoice = async (text, voice = 'alloy', model = 'eleven_monolingual_v1') => {
+const generateVoice = async (text, voice = 'alloy', model = 'eleven_monolingual_v1', format = 'mp3', onTimings = () => {}) => {
   try {
-    return new Promise((resolve, reject) => {
-      // Path to the Python script
-      const pythonScript = path.join(__dirname, '../Engine/voice.py');
-      const engineDir = path.join(__dirname, '../Engine');
-      
-      // Check if we're on Windows and use the virtual environment
-      const pythonCommand = process.platform === 'win32' 
-        ? path.join(engineDir, 'venv', 'Scripts', 'python.exe')
-        : 'python3';
-
-      // Spawn Python process with the text as argument
-      const pythonProcess = spawn(pythonCommand, [pythonScript, text], {
-        cwd: engineDir,
-        stdio: ['pipe', 'pipe', 'pipe']
-      });
-
-      let output = '';
-      let error = '';
-
-      pythonProcess.stdout.on('data', (data) => {
-        output += data.toString();
-      });
-
-      pythonProcess.stderr.on('data', (data) => {
-        error += data.toString();
-      });
+    const result = await engine.request('voice', {
+      text,
+      format,
+      store: storeMedia,
+      chunked: chunkVoice,
+      hedged: hedgeVoice
+    }, { timings: collectTimings });
+    // The stored media URL, or the base64 data URL when the store is disabled
+    const url = result.success ? mediaUrl(result.audio_url, result.audio_data, result.timings) : null;
+    if (result.timings) {
+      onTimings(result.timings);
+    }
+    if (!result.success) {
+      throw new Error(result.error || 'Python script failed');
+    }
+    return url;
+  } catch (error) {
+    console.error('Voice generation error:', error);
+    throw new Error(`Voice generation failed: ${error.message}`);
+  }
+};
 
-      pythonProcess.on('close', (code) => {
-        if (code === 0) {
-          try {
-            // Parse the JSON response from Python
-            const result = JSON.parse(output.trim());
-            if (result.success) {
-              // Return the base64 audio data URL for frontend
-              resolve(result.audio_data);
-            } else {
-              reject(new Error(result.error || 'Python script failed'));
-            }
-          } catch (parseError) {
-            // If JSON parsing fails, assume it's an error message
-            reject(new Error(`Failed to parse response: ${output.trim()}`));
-          }
-        } else {
-          reject(new Error(`Python script failed with code ${code}: ${error}`));
+// Sends each sentence chunk to onChunk as soon as it is playable and resolves with the full audio
+const streamVoice = async (text, voice = 'alloy', model = 'eleven_monolingual_v1', format = 'mp3', onChunk = () => {}, signal) => {
+  try {
+    const result = await engine.request('voice', { text, format, store: storeMedia }, {
+      onEvent: (event) => {
+        if (event.event === 'chunk') {
+          onChunk({
+            index: event.index,
+            count: event.count,
+            text: event.text,
+            audioUrl: event.audio_url || toDataUri(event.audio_data)
+          });
         }
-      });
-
-      pythonProcess.on('error', (err) => {
-        reject(new Error(`Failed to start Python process: ${err.message}`));
-      });
+      },
+      signal
     });
+    if (!result.success) {
+      throw new Error(result.error || 'Python script failed');
+    }
+    return result.audio_url || toDataUri(result.audio_data);
   } catch (error) {
-    console.error('Voice generation error:', error);
+    console.error('Voice streaming error:', error);
     throw new Error(`Voice generation failed: ${error.message}`);
   }
 };
 
 module.exports = {
+  formatServerTiming,
   generateText,
+  streamText,
   generateImage,
-  generateVoice
+  generateVoice,
+  streamVoice
 };
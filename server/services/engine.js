@@ -0,0 +1,420 @@
+// Pool of persistent Python engine processes shared by the AI service functions
+const { spawn } = require('child_process');
+const path = require('path');
+const { performance } = require('perf_hooks');
+
+const engineDir = path.join(__dirname, '../Engine');
+const engineScript = path.join(engineDir, 'engine.py');
+
+// Content-addressed media written by the engines and served under /media
+const mediaDir = process.env.ENGINE_BLOB_DIR || path.join(__dirname, '../media');
+const storeMedia = process.env.MEDIA_STORE !== 'false';
+
+// Check if we're on Windows and use the virtual environment
+const pythonCommand = process.platform === 'win32'
+  ? path.join(engineDir, 'venv', 'Scripts', 'python.exe')
+  : 'python3';
+
+// Pool configuration
+const poolSize = parseInt(process.env.ENGINE_WORKERS, 10) || 2;
+const maxRequestsPerWorker = parseInt(process.env.ENGINE_MAX_REQUESTS, 10) || 500;
+const maxWorkerRssMb = parseInt(process.env.ENGINE_MAX_RSS_MB, 10) || 512;
+const memoryCheckIntervalMs = parseInt(process.env.ENGINE_MEMORY_CHECK_MS, 10) || 30000;
+// The engine answers stats without queueing, so a worker this slow to answer is hung
+const healthTimeoutMs = parseInt(process.env.ENGINE_HEALTH_TIMEOUT_MS, 10) || 10000;
+const requestTimeoutMs = parseInt(process.env.ENGINE_REQUEST_TIMEOUT_MS, 10) || 120000;
+
+// Commands answered by the engine itself rather than by an AI tool
+const controlTools = new Set(['ping', 'stats', 'metrics', 'cancel']);
+
+// Merges the Prometheus text of several workers: each metric family's HELP/TYPE lines
+// must appear once, followed by the samples of every worker (told apart by their worker label)
+const mergeMetrics = (texts) => {
+  const families = new Map();
+  for (const text of texts) {
+    let family = null;
+    for (const line of text.split('\n')) {
+      const comment = line.match(/^# (HELP|TYPE) (\S+)/);
+      if (comment) {
+        family = families.get(comment[2]);
+        if (!family) {
+          family = { meta: [], samples: [] };
+          families.set(comment[2], family);
+        }
+        if (family.meta.length < 2) {
+          family.meta.push(line);
+        }
+      } else if (line && family) {
+        family.samples.push(line);
+      }
+    }
+  }
+  const lines = [];
+  for (const family of families.values()) {
+    lines.push(...family.meta, ...family.samples);
+  }
+  return `${lines.join('\n')}\n`;
+};
+
+// Splits engine stdout into frames: [header length][payload length][header JSON][payload].
+// Chunks are only joined once a whole frame has arrived, so media is copied a single time.
+class FrameReader {
+  constructor(onFrame) {
+    this.onFrame = onFrame;
+    this.chunks = [];
+    this.buffered = 0;
+  }
+
+  push(chunk) {
+    this.chunks.push(chunk);
+    this.buffered += chunk.length;
+
+    while (this.buffered >= 8) {
+      const prefix = this.peek(8);
+      const headerLength = prefix.readUInt32BE(0);
+      const payloadLength = prefix.readUInt32BE(4);
+      const frameLength = 8 + headerLength + payloadLength;
+      if (this.buffered < frameLength) {
+        return;
+      }
+      const frame = this.take(frameLength);
+      this.onFrame(frame.subarray(8, 8 + headerLength), frame.subarray(8 + headerLength));
+    }
+  }
+
+  peek(length) {
+    if (this.chunks[0].length >= length) {
+      return this.chunks[0];
+    }
+    return this.copy(length, false);
+  }
+
+  take(length) {
+    const first = this.chunks[0];
+    if (first.length >= length) {
+      this.chunks[0] = first.subarray(length);
+      if (this.chunks[0].length === 0) {
+        this.chunks.shift();
+      }
+      this.buffered -= length;
+      return first.subarray(0, length);
+    }
+    const frame = this.copy(length, true);
+    this.buffered -= length;
+    return frame;
+  }
+
+  // Copies the first length bytes into one buffer, optionally consuming them
+  copy(length, consume) {
+    const out = Buffer.allocUnsafe(length);
+    let copied = 0;
+    let index = 0;
+    while (copied < length) {
+      const chunk = this.chunks[index];
+      const count = Math.min(chunk.length, length - copied);
+      chunk.copy(out, copied, 0, count);
+      copied += count;
+      if (!consume) {
+        index++;
+      } else if (count === chunk.length) {
+        this.chunks.shift();
+      } else {
+        this.chunks[0] = chunk.subarray(count);
+      }
+    }
+    return out;
+  }
+}
+
+// Media fields arrive as references into the frame payload
+const decodeFrame = (header, payload) => {
+  const message = JSON.parse(header.toString('utf8'));
+  for (const [key, value] of Object.entries(message)) {
+    if (value && value.$media) {
+      message[key] = {
+        mimeType: value.mime_type,
+        data: payload.subarray(value.offset, value.offset + value.length)
+      };
+    }
+  }
+  return message;
+};
+
+class EngineProcess {
+  constructor(onExit = () => {}) {
+    this.process = null;
+    this.pending = new Map();
+    this.nextId = 1;
+    this.served = 0;
+    this.draining = false;
+    this.onExit = onExit;
+  }
+
+  start() {
+    const child = spawn(pythonCommand, [engineScript], {
+      cwd: engineDir,
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+    this.process = child;
+    this.startedAt = Date.now();
+
+    // Each frame on stdout is one response tagged with the request id
+    const reader = new FrameReader((header, payload) => this.handleFrame(header, payload));
+    child.stdout.on('data', (chunk) => reader.push(chunk));
+
+    child.stderr.on('data', (data) => {
+      console.error(`[engine ${child.pid}] ${data.toString().trim()}`);
+    });
+
+    child.on('error', (err) => {
+      this.fail(child, new Error(`Failed to start Python process: ${err.message}`));
+    });
+
+    child.on('exit', (code, signal) => {
+      this.fail(child, new Error(`Python engine exited with ${signal || `code ${code}`}`));
+    });
+  }
+
+  get load() {
+    return this.pending.size;
+  }
+
+  handleFrame(header, payload) {
+    let message;
+    try {
+      message = decodeFrame(header, payload);
+    } catch (parseError) {
+      console.error('Failed to parse engine output:', header.toString('utf8'));
+      return;
+    }
+
+    const request = this.pending.get(message.id);
+    if (!request) {
+      return;
+    }
+
+    // Intermediate events (e.g. streamed text deltas) precede the final response
+    if (message.event) {
+      if (request.onEvent) {
+        request.onEvent(message);
+      }
+      return;
+    }
+
+    this.pending.delete(message.id);
+    clearTimeout(request.timer);
+    if (message.timings) {
+      // Time spent outside the engine's own handling: worker start-up, pipe transfer, framing and decoding
+      const roundTripMs = performance.now() - request.sentAt;
+      message.timings.ipc = Math.max(0, Math.round((roundTripMs - message.timings.total) * 100) / 100);
+    }
+    request.resolve(message);
+
+    // A draining worker exits once its last in-flight request is answered
+    if (this.draining && this.pending.size === 0) {
+      this.stop();
+    }
+  }
+
+  // Reject everything in flight and let the owner replace this worker
+  fail(child, error) {
+    if (this.process !== child) {
+      return;
+    }
+    this.process = null;
+    for (const request of this.pending.values()) {
+      clearTimeout(request.timer);
+      request.reject(error);
+    }
+    this.pending.clear();
+    this.onExit(this);
+  }
+
+  // Options: timeoutMs, onEvent (enables streaming) and an AbortSignal to cancel
+  request(tool, args, { timeoutMs = requestTimeoutMs, onEvent, signal, timings = false } = {}) {
+    if (!this.process) {
+      this.start();
+    }
+
+    const id = this.nextId++;
+    const message = { id, tool, args };
+    if (!controlTools.has(tool)) {
+      this.served++;
+      // The engine enforces the deadline and cancels the upstream call itself
+      message.deadline_ms = timeoutMs;
+    }
+    if (onEvent) {
+      message.stream = true;
+    }
+    if (timings) {
+      message.timings = true;
+    }
+    if (signal) {
+      signal.addEventListener('abort', () => this.cancel(id), { once: true });
+    }
+
+    return new Promise((resolve, reject) => {
+      // Backstop in case the engine never answers
+      const timer = setTimeout(() => {
+        this.cancel(id);
+        this.pending.delete(id);
+        reject(new Error(`Engine request timed out after ${timeoutMs} ms`));
+      }, timeoutMs + 1000);
+      this.pending.set(id, { resolve, reject, timer, onEvent, sentAt: performance.now() });
+      this.process.stdin.write(`${JSON.stringify(message)}\n`);
+    });
+  }
+
+  cancel(id) {
+    if (this.process && this.pending.has(id)) {
+      this.process.stdin.write(`${JSON.stringify({ id: this.nextId++, tool: 'cancel', args: { id } })}\n`);
+    }
+  }
+
+  // Stop accepting work and exit after in-flight requests complete
+  drain() {
+    this.draining = true;
+    if (this.pending.size === 0) {
+      this.stop();
+    }
+  }
+
+  stop(signal = 'SIGTERM') {
+    if (this.process) {
+      this.process.stdin.end();
+      this.process.kill(signal);
+    }
+  }
+}
+
+class EnginePool {
+  constructor(size = poolSize) {
+    this.size = size;
+    this.workers = [];
+    this.memoryTimer = null;
+  }
+
+  // Pre-fork warm workers so the first requests don't pay interpreter start-up
+  start() {
+    if (this.workers.length > 0) {
+      return;
+    }
+    for (let i = 0; i < this.size; i++) {
+      this.spawnWorker();
+    }
+    this.memoryTimer = setInterval(() => this.checkMemory(), memoryCheckIntervalMs);
+    this.memoryTimer.unref();
+  }
+
+  spawnWorker() {
+    const worker = new EngineProcess((exited) => this.replaceWorker(exited));
+    worker.start();
+    this.workers.push(worker);
+    return worker;
+  }
+
+  // Respawn crashed, recycled or oversized workers to keep the pool at full size
+  replaceWorker(worker) {
+    const index = this.workers.indexOf(worker);
+    if (index === -1) {
+      return;
+    }
+    this.workers.splice(index, 1);
+    if (!this.memoryTimer || worker.draining) {
+      return;
+    }
+    // Back off when a worker dies right after starting so a broken install can't spin
+    const delay = Date.now() - worker.startedAt < 1000 ? 1000 : 0;
+    setTimeout(() => {
+      if (this.memoryTimer && this.workers.length < this.size) {
+        this.spawnWorker();
+      }
+    }, delay);
+  }
+
+  recycle(worker) {
+    if (!worker.draining) {
+      worker.drain();
+      // Start the replacement now so capacity doesn't dip while the old worker drains
+      this.workers.splice(this.workers.indexOf(worker), 1);
+      this.spawnWorker();
+    }
+  }
+
+  // Dispatch to the least-loaded worker that is still accepting requests
+  pickWorker() {
+    this.start();
+    let best = null;
+    for (const worker of this.workers) {
+      if (!worker.draining && (!best || worker.load < best.load)) {
+        best = worker;
+      }
+    }
+    return best || this.spawnWorker();
+  }
+
+  request(tool, args, options) {
+    const worker = this.pickWorker();
+    const response = worker.request(tool, args, options);
+    if (worker.served >= maxRequestsPerWorker) {
+      this.recycle(worker);
+    }
+    return response;
+  }
+
+  // Prometheus text for every live worker, merged into one scrape
+  async metrics() {
+    const workers = this.workers.filter((worker) => worker.process);
+    const results = await Promise.allSettled(workers.map((worker) => worker.request('metrics', {})));
+    const texts = results
+      .filter((result) => result.status === 'fulfilled' && result.value.success)
+      .map((result) => result.value.text);
+    return mergeMetrics(texts);
+  }
+
+  async checkMemory() {
+    for (const worker of [...this.workers]) {
+      if (worker.draining || !worker.process) {
+        continue;
+      }
+      const child = worker.process;
+      let stats;
+      try {
+        stats = await worker.request('stats', {}, { timeoutMs: healthTimeoutMs });
+      } catch (error) {
+        // Crashed workers are replaced by their exit handler; one that is still running
+        // but can't answer (a stuck event loop or stdin reader) would never drain, so kill it
+        if (worker.process === child) {
+          console.warn(`Killing engine ${child.pid}: health check failed (${error.message})`);
+          worker.stop('SIGKILL');
+        }
+        continue;
+      }
+      if (stats.rss_mb > maxWorkerRssMb) {
+        console.warn(`Recycling engine ${stats.pid}: ${stats.rss_mb} MB RSS exceeds ${maxWorkerRssMb} MB`);
+        this.recycle(worker);
+      }
+    }
+  }
+
+  stop() {
+    clearInterval(this.memoryTimer);
+    this.memoryTimer = null;
+    for (const worker of this.workers) {
+      worker.stop();
+    }
+    this.workers = [];
+  }
+}
+
+const engine = new EnginePool();
+
+process.on('exit', () => engine.stop());
+
+module.exports = {
+  EngineProcess,
+  EnginePool,
+  engine,
+  mediaDir,
+  storeMedia
+};